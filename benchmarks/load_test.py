@@ -0,0 +1,202 @@
+"""
+Concurrent-session load test for the quiz app.
+
+Simulates N users of one app server with Streamlit's testing API: each user
+picks a random exam, starts a "Full Exam" quiz, answers and submits a few
+questions, ends the quiz and opens the review. All users share the process,
+so they share the cached repository like sessions on one server do.
+
+AppTest's runtime is process-global, so reruns are executed one at a time,
+which is close to what the GIL does to CPU-bound reruns on a real server.
+Latency is what a user waits for a rerun, queueing included; render is the
+rerun alone. Server RSS is sampled after each level.
+
+    python3 benchmarks/load_test.py --users 1 5 10 25 --questions 10
+
+Results are appended to benchmarks/results.jsonl (benchmark "app_rerun",
+scale = users, seconds = p95 latency) next to the pipeline benchmarks.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(REPO, "src"))
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from pipeline import RESULTS_PATH, current_commit  # noqa: E402
+
+APP = os.path.join(REPO, "src", "streamlit_app.py")
+USERS = (1, 5, 10, 25)
+# Data the app reads through relative paths, linked into the scratch directory.
+SHARED_PATHS = ("questions", "questions.db", "duplicates.json")
+
+RUN_LOCK = threading.Lock()
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current RSS outside Linux (KiB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class SimulatedUser:
+    def __init__(self, user_id, questions, think, seed):
+        self.user_id = user_id
+        self.questions = questions
+        self.think = think
+        self.rng = random.Random(seed)
+        self.latencies = []
+        self.renders = []
+        self.app = AppTest.from_file(APP, default_timeout=120)
+
+    def rerun(self, calls_rerun=False):
+        requested = time.perf_counter()
+        with RUN_LOCK:
+            started = time.perf_counter()
+            self.app.run()
+            if calls_rerun:
+                # AppTest's tree still holds elements of the run st.rerun()
+                # stopped, and sending their widget states back fails. The
+                # rerun a browser gets is a plain script run without widget
+                # changes, which is what the private _run() does.
+                self.app._run()
+        finished = time.perf_counter()
+        self.latencies.append(finished - requested)
+        self.renders.append(finished - started)
+        if self.app.exception:
+            raise RuntimeError(f"user {self.user_id}: {self.app.exception[0].message}")
+        if self.think:
+            time.sleep(self.rng.uniform(0, 2 * self.think))
+
+    def widget(self, elements, label):
+        return next(element for element in elements if element.label.startswith(label))
+
+    def click(self, label, calls_rerun=False):
+        self.widget(self.app.button, label).click()
+        self.rerun(calls_rerun)
+
+    def session(self):
+        self.rerun()
+        self.widget(self.app.text_input, "Your name").input(f"load-test-{self.user_id}")
+        self.rerun()
+
+        vendor = self.widget(self.app.selectbox, "Choose a vendor")
+        vendor.select(self.rng.choice(vendor.options))
+        self.rerun()
+        exam = self.widget(self.app.selectbox, "Choose an exam")
+        exam.select(self.rng.choice(exam.options))
+        self.rerun()
+        self.click("Start Quiz", calls_rerun=True)
+
+        for _ in range(self.questions):
+            if self.app.checkbox:
+                self.rng.choice(self.app.checkbox).check()
+                self.rerun()
+            self.click("Submit Answer")
+            self.click("Next", calls_rerun=True)
+
+        self.click("End Quiz Early", calls_rerun=True)
+        self.click("Review Answers")
+
+
+def run_level(users, questions, think, seed):
+    simulated = [
+        SimulatedUser(user_id, questions, think, seed * 1000 + user_id) for user_id in range(users)
+    ]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(SimulatedUser.session, simulated))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for user in simulated for latency in user.latencies]
+    renders = [render for user in simulated for render in user.renders]
+    return {
+        "users": users,
+        "reruns": len(latencies),
+        "elapsed": elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies),
+        "render_mean": sum(renders) / len(renders),
+        "rss_bytes": rss_bytes(),
+    }
+
+
+def scratch_directory():
+    """
+    Working directory for the run: shared data is linked in, so the results
+    store the simulated users write to stays out of the repository
+    """
+    directory = tempfile.mkdtemp(prefix="examtopics_load_test_")
+    for name in SHARED_PATHS:
+        if os.path.exists(os.path.join(REPO, name)):
+            os.symlink(os.path.join(REPO, name), os.path.join(directory, name))
+    return directory
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Load-test the quiz app with concurrent sessions")
+    arg_parser.add_argument("--users", type=int, nargs="+", default=USERS, help="Concurrency levels")
+    arg_parser.add_argument("--questions", type=int, default=10, help="Questions each user answers")
+    arg_parser.add_argument(
+        "--think", type=float, default=0.0, help="Mean think time between actions, in seconds"
+    )
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--results", default=RESULTS_PATH)
+    args = arg_parser.parse_args()
+
+    results_path = os.path.abspath(args.results)
+    commit, dirty = current_commit()
+    os.chdir(scratch_directory())
+    run_id = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    print(
+        f"{'users':>5} {'reruns':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'max ms':>8} {'render ms':>10} {'reruns/s':>9} {'RSS MiB':>8}"
+    )
+    with open(results_path, "a", encoding="utf-8") as results:
+        for users in args.users:
+            level = run_level(users, args.questions, args.think, args.seed)
+            print(
+                f"{users:>5} {level['reruns']:>7} {level['p50'] * 1e3:>8.1f} "
+                f"{level['p95'] * 1e3:>8.1f} {level['p99'] * 1e3:>8.1f} "
+                f"{level['max'] * 1e3:>8.1f} {level['render_mean'] * 1e3:>10.1f} "
+                f"{level['reruns'] / level['elapsed']:>9.1f} {level['rss_bytes'] / 2**20:>8.1f}"
+            )
+            result = {
+                "run": run_id,
+                "commit": commit,
+                "dirty": dirty,
+                "benchmark": "app_rerun",
+                "scale": users,
+                "items": level["reruns"],
+                "seconds": level["p95"],
+                "peak_bytes": level["rss_bytes"],
+                **level,
+            }
+            results.write(json.dumps(result) + "\n")
+    print(f"Results appended to {results_path}")
+
+
+if __name__ == "__main__":
+    main()
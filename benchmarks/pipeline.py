@@ -0,0 +1,294 @@
+"""
+Offline pipeline benchmarks on synthetic corpora of 1k, 10k and 100k questions.
+
+Generates ExamTopics-shaped discussion pages and the matching question JSON
+(cached under --workdir between runs), then times the parser per page and
+per corpus, normalize_text, audit_question_data, load_questions and
+select_questions. Each benchmark reports wall time from a plain run and
+peak Python memory (tracemalloc) from a second, traced run; for the pooled
+corpus parse that is the parent process only.
+
+Results are appended to benchmarks/results.jsonl with the current commit,
+so runs can be compared across commits:
+
+    python3 benchmarks/pipeline.py --scales 1000 10000
+    python3 benchmarks/pipeline.py --compare
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+from audit import audit_question_data  # noqa: E402
+from page_store import DirectoryPageStore  # noqa: E402
+from parser import normalize_text, parse_exam, parse_page  # noqa: E402
+from repository import QuestionRepository  # noqa: E402
+from streamlit_app import select_questions  # noqa: E402
+from utils import write_json_atomic  # noqa: E402
+
+SCALES = (1_000, 10_000, 100_000)
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results.jsonl")
+WORKDIR = os.path.join(tempfile.gettempdir(), "examtopics_benchmarks")
+# Bump when the synthetic data changes so cached corpora are regenerated.
+GENERATOR_VERSION = 1
+
+# parse_page is timed over at most this many pages per scale.
+PAGE_SAMPLE = 1_000
+SELECT_CALLS = 1_000
+
+WORDS = (
+    "data pipeline bucket cluster warehouse table stream policy role query "
+    "schema partition replica latency throughput snapshot lifecycle cost "
+    "encryption region account network gateway function job notebook"
+).split()
+VENDOR, EXAM = "Bench", "exam"
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def synthetic_record(rng, number):
+    letters = "ABCDE"[: rng.randint(3, 5)]
+    most_voted = rng.choice(letters)
+    votes = [{"voted_answers": most_voted, "vote_count": rng.randint(1, 60), "is_most_voted": True}]
+    if rng.random() < 0.6:
+        votes.append(
+            {"voted_answers": rng.choice(letters), "vote_count": rng.randint(1, 30), "is_most_voted": False}
+        )
+    return {
+        "filename": f"result_Bench Exam question {number} discussion.html",
+        "question": f"Question {number}: A company&#39;s caf&eacute; team runs "
+        + sentence(rng, rng.randint(25, 80))
+        + ". Which solution meets these requirements?",
+        "choices": [f"{letter}.{sentence(rng, rng.randint(6, 20))}" for letter in letters],
+        "correct_answer": most_voted,
+        "user_data": votes,
+    }
+
+
+def synthetic_page(rng, record):
+    choices = "".join(
+        f'<li class="multi-choice-item"><span class="multi-choice-letter" '
+        f'data-choice-letter="{choice[0]}">{choice[:2]}</span> {choice[2:]}</li>\n'
+        for choice in record["choices"]
+    )
+    comments = "".join(
+        f"<div class='comment-container'><div class='comment-body'><p>{sentence(rng, 30)}"
+        f" &amp; more</p></div></div>\n"
+        for _ in range(rng.randint(5, 40))
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Exam question</title>"
+        + '<script>var config = {"theme": "<div>"};</script>' * 20
+        + "<style>.card-text{margin:0}</style></head><body>\n"
+        + '<nav class="navbar"><div class="container"><a href="/">Home</a></div></nav>\n'
+        + '<div class="discussion-header-container"><div class="question-body mt-3 pt-3 border-top">\n'
+        + f'<p class="card-text">\n {record["question"]}  </p>\n'
+        + f'<div class="question-choices-container"><ul>\n{choices}</ul></div>\n'
+        + '<p class="card-text question-answer bg-light white-text">Suggested Answer: '
+        + f'<span class="correct-answer">{record["correct_answer"]}</span></p>\n'
+        + '<div class="voted-answers-tally d-none"><script type="application/json">'
+        + json.dumps(record["user_data"])
+        + "</script></div>\n</div></div>\n"
+        + comments
+        + "</body></html>\n"
+    )
+
+
+def generate_corpus(workdir, scale):
+    """
+    Pages and question JSON for one scale, reused while GENERATOR_VERSION
+    matches. Returns (pages dir, questions dir).
+    """
+    root = os.path.join(workdir, str(scale))
+    pages_dir = os.path.join(root, "pages")
+    questions_dir = os.path.join(root, "questions")
+    marker = os.path.join(root, "generator_version")
+    try:
+        with open(marker) as file:
+            if int(file.read()) == GENERATOR_VERSION:
+                return pages_dir, questions_dir
+    except (FileNotFoundError, ValueError):
+        pass
+
+    print(f"Generating {scale} synthetic pages in {root}")
+    rng = random.Random(scale)
+    os.makedirs(pages_dir, exist_ok=True)
+    os.makedirs(os.path.join(questions_dir, VENDOR), exist_ok=True)
+    records = []
+    for number in range(1, scale + 1):
+        record = synthetic_record(rng, number)
+        with open(os.path.join(pages_dir, record["filename"]), "w", encoding="utf-8") as file:
+            file.write(synthetic_page(rng, record))
+        records.append(record)
+    write_json_atomic(os.path.join(questions_dir, VENDOR, f"{EXAM}.json"), records)
+    with open(marker, "w") as file:
+        file.write(str(GENERATOR_VERSION))
+    return pages_dir, questions_dir
+
+
+def measure(func):
+    """
+    (wall seconds of a plain run, peak traced bytes of a second run)
+    """
+    gc.collect()
+    started = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - started
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def benchmarks(pages_dir, questions_dir, scale, workers):
+    """
+    (name, function, items it processes) for one scale
+    """
+    with open(os.path.join(questions_dir, VENDOR, f"{EXAM}.json")) as file:
+        records = json.load(file)
+    store = DirectoryPageStore(pages_dir)
+    sample = [
+        (record["filename"], store.read("", record["filename"])) for record in records[:PAGE_SAMPLE]
+    ]
+    texts = [text for record in records for text in (record["question"], *record["choices"])]
+    positions = list(range(scale))
+
+    return [
+        ("parse_page", lambda: [parse_page(raw, filename) for filename, raw in sample], len(sample)),
+        ("parse_corpus", lambda: parse_exam(store, "", workers), scale),
+        ("normalize_text", lambda: [normalize_text(text) for text in texts], len(texts)),
+        ("audit_question_data", lambda: audit_question_data(records), scale),
+        (
+            "load_questions",
+            # A fresh repository without a corpus: a cold JSON load
+            lambda: QuestionRepository(
+                questions_dir, corpus_path=os.path.join(questions_dir, "missing.db")
+            ).questions(VENDOR, EXAM),
+            scale,
+        ),
+        (
+            "select_questions",
+            lambda: [select_questions(positions, "custom", num_questions=50) for _ in range(SELECT_CALLS)],
+            SELECT_CALLS,
+        ),
+    ]
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+
+def run(scales, workers, workdir, results_path):
+    commit, dirty = current_commit()
+    run_id = time.strftime("%Y-%m-%dT%H:%M:%S")
+    environment = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+    print(f"{'benchmark':<20} {'scale':>7} {'seconds':>10} {'per item':>12} {'peak MiB':>9}")
+    with open(results_path, "a", encoding="utf-8") as results:
+        for scale in scales:
+            pages_dir, questions_dir = generate_corpus(workdir, scale)
+            for name, func, items in benchmarks(pages_dir, questions_dir, scale, workers):
+                seconds, peak = measure(func)
+                print(
+                    f"{name:<20} {scale:>7} {seconds:>10.4f} "
+                    f"{seconds / items * 1e6:>10.1f}us {peak / 2**20:>9.1f}"
+                )
+                result = {
+                    "run": run_id,
+                    "commit": commit,
+                    "dirty": dirty,
+                    **environment,
+                    "benchmark": name,
+                    "scale": scale,
+                    "items": items,
+                    "seconds": seconds,
+                    "peak_bytes": peak,
+                }
+                results.write(json.dumps(result) + "\n")
+    print(f"Results appended to {results_path}")
+
+
+def compare(results_path):
+    """
+    Latest run against the run before it, per benchmark and scale
+    """
+    with open(results_path, encoding="utf-8") as file:
+        results = [json.loads(line) for line in file if line.strip()]
+    runs = sorted({result["run"] for result in results})
+    if len(runs) < 2:
+        print("Need at least two runs to compare")
+        return
+    baseline, latest = runs[-2], runs[-1]
+    by_key = {(result["run"], result["benchmark"], result["scale"]): result for result in results}
+
+    def label(run_id):
+        result = next(result for result in results if result["run"] == run_id)
+        return f"{result['commit']}{'+dirty' if result['dirty'] else ''} ({run_id})"
+
+    print(f"baseline: {label(baseline)}\nlatest:   {label(latest)}")
+    print(f"{'benchmark':<20} {'scale':>7} {'seconds':>21} {'ratio':>7} {'peak MiB':>19}")
+    for (run_id, name, scale), result in by_key.items():
+        old = by_key.get((baseline, name, scale))
+        if run_id != latest or old is None:
+            continue
+        print(
+            f"{name:<20} {scale:>7} {old['seconds']:>10.4f}{result['seconds']:>11.4f} "
+            f"{result['seconds'] / old['seconds']:>7.2f} "
+            f"{old['peak_bytes'] / 2**20:>9.1f}{result['peak_bytes'] / 2**20:>10.1f}"
+        )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the offline pipeline")
+    arg_parser.add_argument("--scales", type=int, nargs="+", default=SCALES)
+    arg_parser.add_argument(
+        "--workers", type=int, default=None, help="Parser processes for parse_corpus"
+    )
+    arg_parser.add_argument("--workdir", default=WORKDIR, help="Where synthetic corpora are cached")
+    arg_parser.add_argument("--results", default=RESULTS_PATH)
+    arg_parser.add_argument(
+        "--compare", action="store_true", help="Compare the last two runs instead of running"
+    )
+    args = arg_parser.parse_args()
+
+    if args.compare:
+        compare(args.results)
+    else:
+        run(args.scales, args.workers, args.workdir, args.results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Per-session quiz state memory for growing exam sizes.
+
+Compares the state a session keeps after starting a "Full Exam" quiz and
+answering a few questions: the old copied question list against the
+positions + answer bitmask representation in streamlit_app.init_quiz_state.
+
+    python3 benchmarks/session_memory.py
+"""
+import logging
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+import streamlit as st  # noqa: E402
+
+import streamlit_app  # noqa: E402
+
+EXAM_SIZES = (100, 1_000, 10_000, 100_000)
+ANSWERED = 20
+
+
+def synthetic_question(i):
+    return {
+        "question_number": i + 1,
+        "question": f"Question {i} " + "lorem ipsum dolor sit amet " * 20,
+        "choices": [f"{letter}.Choice {letter} " + "consectetur " * 8 for letter in "ABCD"],
+        "correct_answers": ["B"],
+    }
+
+
+def legacy_session(questions):
+    # Old layout: every session held its own copy of every question dict
+    state = {
+        "questions": [dict(question) for question in questions],
+        "user_answers": {},
+        "correct_answers": set(),
+    }
+    for i in random.sample(range(len(questions)), ANSWERED):
+        state["user_answers"][i] = ["A", "C"]
+        state["correct_answers"].add(i)
+    return state
+
+
+def current_session(questions):
+    streamlit_app.init_quiz_state("benchmark", range(len(questions)))
+    for i in random.sample(range(len(questions)), ANSWERED):
+        st.session_state.user_answers[i] = 0b101
+        st.session_state.correct_answers[i] = 1
+    return dict(st.session_state)
+
+
+def measure(build, questions):
+    tracemalloc.start()
+    state = build(questions)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del state
+    return size
+
+
+def main():
+    random.seed(0)
+    print(f"{'questions':>10} {'legacy bytes':>14} {'current bytes':>14} {'current/question':>17}")
+    for exam_size in EXAM_SIZES:
+        # The shared corpus is built once per process, outside the measurement
+        questions = tuple(synthetic_question(i) for i in range(exam_size))
+        legacy = measure(legacy_session, questions)
+        current = measure(current_session, questions)
+        print(f"{exam_size:>10} {legacy:>14} {current:>14} {current / exam_size:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
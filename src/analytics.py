@@ -0,0 +1,160 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from config import QUESTIONS_DIR
+from corpus import list_exam_files
+from utils import iter_json_array, question_number
+
+
+LOW_CONSENSUS = 0.6
+MIN_VOTES = 5
+
+
+def normalize_answers(values):
+    """
+    Canonical answer strings ("CA" -> "AC") for an array of answers,
+    normalizing each distinct value once
+    """
+    uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    canonical = np.array(["".join(sorted(value)) for value in uniques], dtype=object)
+    return canonical[inverse]
+
+
+def load_vote_columns(questions_dir=QUESTIONS_DIR):
+    """
+    Stream every exam into columnar arrays.
+
+    Returns (questions, votes): a DataFrame with one row per question and a
+    dict of NumPy arrays with one entry per vote row, linked by question_id.
+    """
+    exams, filenames, numbers, correct = [], [], [], []
+    vote_question, vote_answer, vote_count = [], [], []
+
+    for vendor, name, path in list_exam_files(questions_dir):
+        exam = f"{vendor}/{name}"
+        with open(path, "r") as file:
+            for item in iter_json_array(file):
+                question_id = len(filenames)
+                filename = item.get("filename") or ""
+                exams.append(exam)
+                filenames.append(filename)
+                numbers.append(question_number(filename) or -1)
+                correct.append(item.get("correct_answer") or "")
+                for vote in item.get("user_data") or []:
+                    vote_question.append(question_id)
+                    vote_answer.append(vote.get("voted_answers") or "")
+                    vote_count.append(vote.get("vote_count") or 0)
+
+    questions = pd.DataFrame(
+        {
+            "exam": pd.Categorical(exams),
+            "filename": filenames,
+            "question_number": np.array(numbers, dtype=np.int32),
+            "correct_answer": normalize_answers(correct),
+        }
+    )
+    votes = {
+        "question_id": np.array(vote_question, dtype=np.int64),
+        "answer": normalize_answers(vote_answer),
+        "count": np.array(vote_count, dtype=np.float64),
+    }
+    return questions, votes
+
+
+def vote_consensus(questions, votes):
+    """
+    Add per-question vote statistics to questions, fully vectorized:
+    total_votes, most_voted (answer), consensus (share of the most-voted
+    answer), entropy (bits) and disagrees (official answer differs from the
+    most-voted one)
+    """
+    n = len(questions)
+    question_id, count = votes["question_id"], votes["count"]
+
+    total = np.bincount(question_id, weights=count, minlength=n)
+    share = np.divide(
+        count, total[question_id], out=np.zeros_like(count), where=total[question_id] > 0
+    )
+    information = np.zeros_like(share)
+    np.multiply(-share, np.log2(share, where=share > 0, out=np.zeros_like(share)), out=information)
+    entropy = np.bincount(question_id, weights=information, minlength=n)
+
+    # Most-voted row per question: sort by question, then by count descending
+    order = np.lexsort((-count, question_id))
+    sorted_ids = question_id[order]
+    first = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if len(order) else order
+    top_rows = order[first]
+
+    most_voted = np.full(n, "", dtype=object)
+    top_count = np.zeros(n)
+    most_voted[question_id[top_rows]] = votes["answer"][top_rows]
+    top_count[question_id[top_rows]] = count[top_rows]
+
+    result = questions.copy()
+    result["total_votes"] = total.astype(np.int64)
+    result["most_voted"] = most_voted
+    result["consensus"] = np.divide(
+        top_count, total, out=np.full(n, np.nan), where=total > 0
+    )
+    result["entropy"] = entropy
+    result["disagrees"] = (
+        (result["correct_answer"].to_numpy() != most_voted)
+        & (total > 0)
+        & (result["correct_answer"].to_numpy() != "")
+    )
+    return result
+
+
+def low_confidence(stats, min_consensus=LOW_CONSENSUS, min_votes=MIN_VOTES):
+    """
+    Questions whose answer key should be checked: the official answer
+    disagrees with the vote, the vote is split, or there are too few votes
+    """
+    flagged = stats[
+        stats["disagrees"]
+        | (stats["consensus"] < min_consensus)
+        | (stats["total_votes"] < min_votes)
+    ]
+    return flagged.sort_values(["exam", "consensus", "question_number"])
+
+
+def exam_summary(stats):
+    return stats.groupby("exam", observed=True).agg(
+        questions=("filename", "size"),
+        votes=("total_votes", "sum"),
+        mean_consensus=("consensus", "mean"),
+        mean_entropy=("entropy", "mean"),
+        disagreements=("disagrees", "sum"),
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Vote-consensus analytics across every exam"
+    )
+    arg_parser.add_argument("--questions-dir", default=QUESTIONS_DIR)
+    arg_parser.add_argument("--min-consensus", type=float, default=LOW_CONSENSUS)
+    arg_parser.add_argument("--min-votes", type=int, default=MIN_VOTES)
+    arg_parser.add_argument(
+        "--output", default="low_confidence_questions.csv", help="CSV of flagged questions"
+    )
+    args = arg_parser.parse_args()
+
+    questions, votes = load_vote_columns(args.questions_dir)
+    stats = vote_consensus(questions, votes)
+    flagged = low_confidence(stats, args.min_consensus, args.min_votes)
+    flagged.to_csv(args.output, index=False)
+
+    with pd.option_context("display.width", 120, "display.max_columns", 10):
+        print(exam_summary(stats).round(3))
+    print(
+        f"\n{len(flagged)} low-confidence question(s), "
+        f"{int(stats['disagrees'].sum())} answer key disagreement(s). "
+        f"Saved to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,106 +1,252 @@
+import argparse
 import json
-from collections import defaultdict
-import re
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
+from config import QUESTIONS_DIR
+from corpus import list_exam_files
+from utils import iter_json_array, question_number
 
-def audit_question_data(data):
+
+class ExamAudit:
     """
-    Analyze question data and generate audit statistics
+    Single-pass audit accumulator: feed records with add(), read report()
     """
-    audit_report = {
-        "total_questions": len(data),
-        "question_numbers": [],
-        "null_count": defaultdict(int),
-        "choice_stats": {
-            "min_choices": float("inf"),
-            "max_choices": 0,
-            "avg_choices": 0,
-        },
-        "voting_stats": {
-            "total_votes": 0,
-            "questions_with_votes": 0,
-            "highest_voted_question": None,
-            "highest_vote_count": 0,
-        },
-        "correct_answer_distribution": defaultdict(int),
-    }
 
-    for item in data:
-        match = re.search(r"question (\d+)", item["filename"])
-        if match:
-            audit_report["question_numbers"].append(int(match.group(1)))
+    def __init__(self):
+        self.total_questions = 0
+        self.question_numbers = Counter()
+        self.null_count = defaultdict(int)
+        self.choice_histogram = Counter()
+        self.choice_total = 0
+        self.total_votes = 0
+        self.questions_with_votes = 0
+        self.highest_voted_question = None
+        self.highest_vote_count = 0
+        self.correct_answer_distribution = defaultdict(int)
+
+    def add(self, item):
+        self.total_questions += 1
+
+        number = question_number(item.get("filename") or "")
+        if number is not None:
+            self.question_numbers[number] += 1
 
         for key, value in item.items():
             if value is None:
-                audit_report["null_count"][key] += 1
+                self.null_count[key] += 1
 
-        num_choices = len(item["choices"])
-        audit_report["choice_stats"]["min_choices"] = min(
-            audit_report["choice_stats"]["min_choices"], num_choices
-        )
-        audit_report["choice_stats"]["max_choices"] = max(
-            audit_report["choice_stats"]["max_choices"], num_choices
-        )
+        num_choices = len(item.get("choices") or [])
+        self.choice_histogram[num_choices] += 1
+        self.choice_total += num_choices
 
-        audit_report["correct_answer_distribution"][item["correct_answer"]] += 1
-
-        total_votes_for_question = sum(vote["vote_count"] for vote in item["user_data"])
-        audit_report["voting_stats"]["total_votes"] += total_votes_for_question
+        self.correct_answer_distribution[item.get("correct_answer")] += 1
 
+        total_votes_for_question = sum(
+            vote.get("vote_count", 0) for vote in item.get("user_data") or []
+        )
+        self.total_votes += total_votes_for_question
         if total_votes_for_question > 0:
-            audit_report["voting_stats"]["questions_with_votes"] += 1
+            self.questions_with_votes += 1
+        if total_votes_for_question > self.highest_vote_count:
+            self.highest_vote_count = total_votes_for_question
+            self.highest_voted_question = item.get("filename")
+
+    def merge(self, other):
+        self.total_questions += other.total_questions
+        self.question_numbers.update(other.question_numbers)
+        for key, count in other.null_count.items():
+            self.null_count[key] += count
+        self.choice_histogram.update(other.choice_histogram)
+        self.choice_total += other.choice_total
+        self.total_votes += other.total_votes
+        self.questions_with_votes += other.questions_with_votes
+        if other.highest_vote_count > self.highest_vote_count:
+            self.highest_vote_count = other.highest_vote_count
+            self.highest_voted_question = other.highest_voted_question
+        for answer, count in other.correct_answer_distribution.items():
+            self.correct_answer_distribution[answer] += count
+
+    def report(self, with_numbers=True):
+        numbers = sorted(self.question_numbers)
+        gaps = []
+        for previous, current in zip(numbers, numbers[1:]):
+            if current - previous > 1:
+                gaps.append([previous + 1, current - 1])
+
+        report = {
+            "total_questions": self.total_questions,
+            "question_numbers": numbers,
+            "question_number_gaps": gaps,
+            "duplicate_question_numbers": sorted(
+                number for number, count in self.question_numbers.items() if count > 1
+            ),
+            "null_count": dict(self.null_count),
+            "choice_stats": {
+                "min_choices": min(self.choice_histogram, default=0),
+                "max_choices": max(self.choice_histogram, default=0),
+                "avg_choices": (
+                    self.choice_total / self.total_questions
+                    if self.total_questions
+                    else 0
+                ),
+                "histogram": dict(sorted(self.choice_histogram.items())),
+            },
+            "voting_stats": {
+                "total_votes": self.total_votes,
+                "questions_with_votes": self.questions_with_votes,
+                "highest_voted_question": self.highest_voted_question,
+                "highest_vote_count": self.highest_vote_count,
+            },
+            "correct_answer_distribution": {
+                str(answer): count
+                for answer, count in self.correct_answer_distribution.items()
+            },
+        }
+        if not with_numbers:
+            # Question numbers, gaps and duplicates are per exam
+            for key in ("question_numbers", "question_number_gaps", "duplicate_question_numbers"):
+                del report[key]
+        return report
 
-        if (
-            total_votes_for_question
-            > audit_report["voting_stats"]["highest_vote_count"]
-        ):
-            audit_report["voting_stats"][
-                "highest_vote_count"
-            ] = total_votes_for_question
-            audit_report["voting_stats"]["highest_voted_question"] = item["filename"]
 
-    audit_report["choice_stats"]["avg_choices"] = len(data[0]["choices"]) if data else 0
-    audit_report["question_numbers"].sort()
-    return audit_report
+def audit_question_data(data):
+    """
+    Analyze question data and generate audit statistics
+    """
+    audit = ExamAudit()
+    for item in data:
+        audit.add(item)
+    return audit.report()
 
 
-def main():
+def audit_exam_file(path):
+    """
+    Stream one exam file through an ExamAudit
+    """
+    audit = ExamAudit()
+    with open(path, "r") as file:
+        for item in iter_json_array(file):
+            audit.add(item)
+    return audit
+
+
+def _audit_worker(path):
     try:
-        with open("./questions/AWS/data_engineer_associate.json", "r") as file:
-            data = json.load(file)
-
-        audit_report = audit_question_data(data)
-
-        with open("audit_report.json", "w") as f:
-            json.dump(audit_report, f, indent=4)
-
-        print("\n=== Question Data Audit Report ===")
-        print(f"Total Questions: {audit_report['total_questions']}")
-        print(f"Question Numbers Found: {audit_report['question_numbers']}")
-        print("\nNull Values Found:")
-        for field, count in audit_report["null_count"].items():
-            print(f"  {field}: {count}")
-        print("\nChoice Statistics:")
-        print(f"  Minimum Choices: {audit_report['choice_stats']['min_choices']}")
-        print(f"  Maximum Choices: {audit_report['choice_stats']['max_choices']}")
-        print(f"  Average Choices: {audit_report['choice_stats']['avg_choices']}")
-        print("\nVoting Statistics:")
-        print(f"  Total Votes: {audit_report['voting_stats']['total_votes']}")
-        print(
-            f"  Questions with Votes: {audit_report['voting_stats']['questions_with_votes']}"
-        )
-        print(
-            f"  Most Voted Question: {audit_report['voting_stats']['highest_voted_question']}"
-        )
+        return audit_exam_file(path), None
+    except Exception as e:
+        return None, f"[pid {os.getpid()}] {path}: {e}"
+
+
+def audit_corpus(questions_dir=QUESTIONS_DIR, workers=None):
+    """
+    Audit every exam under questions_dir in parallel.
+
+    Returns (report, errors) where report has per-exam reports under "exams"
+    and the combined totals under "aggregate".
+    """
+    exam_files = list_exam_files(questions_dir)
+    paths = [path for _, _, path in exam_files]
+    workers = min(workers or os.cpu_count() or 1, max(len(paths), 1))
+
+    if workers == 1:
+        results = [_audit_worker(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_audit_worker, paths))
+
+    aggregate = ExamAudit()
+    exams = {}
+    errors = []
+    for (vendor, name, _), (audit, error) in zip(exam_files, results):
+        if error:
+            errors.append(error)
+            continue
+        exams[f"{vendor}/{name}"] = audit.report()
+        aggregate.merge(audit)
+
+    report = {"exams": exams, "aggregate": aggregate.report(with_numbers=False)}
+    return report, errors
+
+
+def exam_issues(report):
+    """
+    Problems that should fail a post-parse gate
+    """
+    issues = []
+    if report["null_count"].get("question"):
+        issues.append(f"{report['null_count']['question']} question(s) without text")
+    if report["choice_stats"]["histogram"].get(0):
+        issues.append(f"{report['choice_stats']['histogram'][0]} question(s) without choices")
+    if report["duplicate_question_numbers"]:
+        issues.append(f"duplicate question numbers {report['duplicate_question_numbers']}")
+    return issues
+
+
+def print_report(report):
+    print("\n=== Question Data Audit Report ===")
+    print(
+        f"{'Exam':<45} {'Questions':>9} {'Missing':>7} {'Nulls':>6} {'Choices':>12} {'Votes':>8}"
+    )
+    for exam, exam_report in report["exams"].items():
+        choice_stats = exam_report["choice_stats"]
+        missing = sum(end - start + 1 for start, end in exam_report["question_number_gaps"])
         print(
-            f"  Highest Vote Count: {audit_report['voting_stats']['highest_vote_count']}"
+            f"{exam:<45} {exam_report['total_questions']:>9} {missing:>7} "
+            f"{sum(exam_report['null_count'].values()):>6} "
+            f"{choice_stats['min_choices']:>3}-{choice_stats['max_choices']:<3}"
+            f"({choice_stats['avg_choices']:.1f}) "
+            f"{exam_report['voting_stats']['total_votes']:>8}"
         )
-        print("\nCorrect Answer Distribution:")
-        for answer, count in audit_report["correct_answer_distribution"].items():
-            print(f"  Option {answer}: {count}")
 
-    except Exception as e:
-        print(f"Error: {str(e)}")
+    aggregate = report["aggregate"]
+    print(f"\nTotal Questions: {aggregate['total_questions']}")
+    print("\nNull Values Found:")
+    for field, count in aggregate["null_count"].items():
+        print(f"  {field}: {count}")
+    print("\nChoice Count Histogram:")
+    for choices, count in aggregate["choice_stats"]["histogram"].items():
+        print(f"  {choices} choices: {count}")
+    print("\nVoting Statistics:")
+    print(f"  Total Votes: {aggregate['voting_stats']['total_votes']}")
+    print(f"  Questions with Votes: {aggregate['voting_stats']['questions_with_votes']}")
+    print(f"  Most Voted Question: {aggregate['voting_stats']['highest_voted_question']}")
+    print(f"  Highest Vote Count: {aggregate['voting_stats']['highest_vote_count']}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Audit every exam under the questions directory"
+    )
+    arg_parser.add_argument("--questions-dir", default=QUESTIONS_DIR)
+    arg_parser.add_argument("--output", default="audit_report.json")
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Exit with status 1 if any exam has missing text, choices or duplicates",
+    )
+    args = arg_parser.parse_args()
+
+    report, errors = audit_corpus(args.questions_dir, workers=args.workers)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    print_report(report)
+    for error in errors:
+        print(f"Error: {error}")
+
+    issues = {
+        exam: exam_issues(exam_report) for exam, exam_report in report["exams"].items()
+    }
+    issues = {exam: problems for exam, problems in issues.items() if problems}
+    if issues:
+        print("\nIssues:")
+        for exam, problems in issues.items():
+            print(f"  {exam}: {'; '.join(problems)}")
+    if args.strict and (issues or errors):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,53 @@
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
+
+SEARCH_HOST = "www.google.com"
+
+# Per-host request budget as (requests per second, burst size). The search
+# budget matches the old 41-50 s sleep between queries.
+HOST_RATE_LIMITS = {
+    SEARCH_HOST: (1 / 45, 1),
+    "www.examtopics.com": (1 / 5, 2),
+}
+DEFAULT_RATE_LIMIT = (1 / 5, 1)
+
+# Upper bound for any single backoff, matching the old one hour 429 sleep.
+MAX_BACKOFF = 3600
+
+# Persistent query -> discussion URL cache shared by all crawls.
+URL_CACHE_PATH = "./html_pages/url_cache.json"
+
+# Where raw pages live: "directory" keeps loose .html files under
+# HTML_PAGES_DIR, "blob" keeps compressed content-addressed blobs under
+# PAGE_STORE_DIR.
+PAGE_STORE = "directory"
+HTML_PAGES_DIR = "./html_pages"
+PAGE_STORE_DIR = "./page_store"
+
+QUESTIONS_DIR = "./questions"
+
+# Parsed exams kept in memory by the app, shared by every session.
+QUESTION_CACHE_SIZE = 8
+
+# Compiled, indexed copy of QUESTIONS_DIR built by corpus.py.
+CORPUS_PATH = "./questions.db"
+
+# Near-duplicate question clusters across all exams, built by dedup.py.
+DUPLICATES_PATH = "./duplicates.json"
+
+# Quiz sessions and answers of every user, written by results.py.
+RESULTS_PATH = "./results.db"
+
+# Instrumentation (metrics.py). When enabled, the app serves Prometheus
+# text on http://127.0.0.1:METRICS_PORT/metrics.
+METRICS_ENABLED = False
+METRICS_PORT = 9464
+
+# Object storage sync (sync.py) of the page store and questions. None
+# disables the app's warm start from the bucket; SYNC_ENDPOINT_URL points
+# at S3-compatible stores such as MinIO.
+SYNC_BUCKET = None
+SYNC_PREFIX = "examtopics"
+SYNC_ENDPOINT_URL = None
+SYNC_WORKERS = 16
+# Local hash cache and last seen bucket manifest.
+SYNC_STATE_PATH = "./.sync_state.json"
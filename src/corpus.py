@@ -0,0 +1,320 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from config import CORPUS_PATH, QUESTIONS_DIR
+from utils import question_number
+
+
+# Bump whenever the schema changes so existing corpora are recompiled in full.
+CORPUS_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exams (
+    id INTEGER PRIMARY KEY,
+    vendor TEXT NOT NULL,
+    name TEXT NOT NULL,
+    source_mtime_ns INTEGER NOT NULL,
+    source_size INTEGER NOT NULL,
+    record_count INTEGER NOT NULL,
+    question_count INTEGER NOT NULL,
+    UNIQUE (vendor, name)
+);
+CREATE TABLE IF NOT EXISTS questions (
+    exam_id INTEGER NOT NULL REFERENCES exams (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    quiz_position INTEGER,
+    question_number INTEGER,
+    filename TEXT,
+    choice_count INTEGER NOT NULL,
+    consensus REAL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (exam_id, position)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS questions_quiz_position
+    ON questions (exam_id, quiz_position) WHERE quiz_position IS NOT NULL;
+CREATE INDEX IF NOT EXISTS questions_number ON questions (exam_id, question_number);
+CREATE VIRTUAL TABLE IF NOT EXISTS question_text USING fts5 (
+    question,
+    choices,
+    exam_id UNINDEXED,
+    quiz_position UNINDEXED,
+    prefix = '2 3'
+);
+"""
+
+SEARCH_TERM = re.compile(r"\w+")
+
+
+def build_question(item):
+    """
+    Quiz question from a parsed record, or None if it cannot be asked.
+    The most-voted answer is used as the answer key; consensus is its share
+    of all votes, None without votes.
+    """
+    question_text = item.get("question")
+    choices = item.get("choices", [])
+    user_data = item.get("user_data", [])
+    consensus = None
+    if user_data:
+        most_voted = max(user_data, key=lambda x: x.get("vote_count", 0))
+        correct_answers = list(most_voted.get("voted_answers", ""))
+        total_votes = sum(vote.get("vote_count", 0) for vote in user_data)
+        if total_votes:
+            consensus = most_voted.get("vote_count", 0) / total_votes
+    else:
+        correct_answers = []
+
+    if not (question_text and choices):
+        return None
+    return {
+        "question_number": question_number(item.get("filename") or ""),
+        "filename": item.get("filename"),
+        "question": question_text,
+        "choices": choices,
+        "correct_answers": correct_answers,
+        "consensus": consensus,
+    }
+
+
+def list_exam_files(questions_dir=QUESTIONS_DIR):
+    """
+    (vendor, exam name, path) for every exam JSON under questions_dir
+    """
+    exam_files = []
+    for vendor in sorted(os.listdir(questions_dir)):
+        vendor_dir = os.path.join(questions_dir, vendor)
+        if not os.path.isdir(vendor_dir):
+            continue
+        for filename in sorted(os.listdir(vendor_dir)):
+            if filename.endswith(".json"):
+                exam_files.append(
+                    (vendor, filename[:-5], os.path.join(vendor_dir, filename))
+                )
+    return exam_files
+
+
+def _delete_exams(connection, exams):
+    # The full-text table is not covered by the foreign key cascade.
+    for vendor, name in exams:
+        connection.execute(
+            "DELETE FROM question_text WHERE exam_id IN "
+            "(SELECT id FROM exams WHERE vendor = ? AND name = ?)",
+            (vendor, name),
+        )
+        connection.execute(
+            "DELETE FROM exams WHERE vendor = ? AND name = ?", (vendor, name)
+        )
+
+
+def _insert_exam(connection, vendor, name, path, stat):
+    with open(path, "r") as file:
+        data = json.load(file)
+
+    _delete_exams(connection, [(vendor, name)])
+    rows = []
+    texts = []
+    quiz_position = 0
+    for position, item in enumerate(data):
+        question = build_question(item)
+        quizzable = question is not None
+        if quizzable:
+            texts.append(
+                (item["question"], "\n".join(item["choices"]), quiz_position)
+            )
+        filename = item.get("filename") or ""
+        rows.append(
+            (
+                position,
+                quiz_position if quizzable else None,
+                question_number(filename),
+                filename,
+                len(item.get("choices") or []),
+                question["consensus"] if quizzable else None,
+                json.dumps(item),
+            )
+        )
+        quiz_position += quizzable
+
+    exam_id = connection.execute(
+        "INSERT INTO exams (vendor, name, source_mtime_ns, source_size, "
+        "record_count, question_count) VALUES (?, ?, ?, ?, ?, ?)",
+        (vendor, name, stat.st_mtime_ns, stat.st_size, len(rows), quiz_position),
+    ).lastrowid
+    connection.executemany(
+        "INSERT INTO questions (exam_id, position, quiz_position, question_number, "
+        "filename, choice_count, consensus, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(exam_id, *row) for row in rows],
+    )
+    connection.executemany(
+        "INSERT INTO question_text (question, choices, exam_id, quiz_position) "
+        "VALUES (?, ?, ?, ?)",
+        [(question, choices, exam_id, position) for question, choices, position in texts],
+    )
+
+
+def build_corpus(questions_dir=QUESTIONS_DIR, corpus_path=CORPUS_PATH):
+    """
+    Compile every exam JSON into the SQLite corpus, including its full-text
+    index. Exams whose source file is unchanged are kept; exams whose file
+    is gone are removed.
+
+    Returns (compiled, unchanged, removed) exam counts.
+    """
+    connection = sqlite3.connect(corpus_path)
+    try:
+        connection.execute("PRAGMA foreign_keys = ON")
+        if connection.execute("PRAGMA user_version").fetchone()[0] != CORPUS_VERSION:
+            # Corpora from an older schema are rebuilt from scratch.
+            connection.executescript(
+                "DROP TABLE IF EXISTS question_text; "
+                "DROP TABLE IF EXISTS questions; "
+                "DROP TABLE IF EXISTS exams;"
+            )
+        connection.executescript(SCHEMA)
+        known = {
+            (vendor, name): (mtime_ns, size)
+            for vendor, name, mtime_ns, size in connection.execute(
+                "SELECT vendor, name, source_mtime_ns, source_size FROM exams"
+            )
+        }
+
+        compiled = unchanged = 0
+        exam_files = list_exam_files(questions_dir)
+        with connection:
+            for vendor, name, path in exam_files:
+                stat = os.stat(path)
+                if known.get((vendor, name)) == (stat.st_mtime_ns, stat.st_size):
+                    unchanged += 1
+                    continue
+                _insert_exam(connection, vendor, name, path, stat)
+                compiled += 1
+
+            gone = set(known) - {(vendor, name) for vendor, name, _ in exam_files}
+            _delete_exams(connection, sorted(gone))
+            connection.execute(f"PRAGMA user_version = {CORPUS_VERSION}")
+    finally:
+        connection.close()
+    return compiled, unchanged, len(gone)
+
+
+class Corpus:
+    """
+    Read-only access to the compiled corpus. Exam metadata and single
+    questions come straight from the indexes; nothing loads a whole exam.
+    Each thread gets its own connection.
+    """
+
+    def __init__(self, path=CORPUS_PATH):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        if not hasattr(self.local, "connection"):
+            self.local.connection = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, timeout=5
+            )
+        return self.local.connection
+
+    def exam(self, vendor, name):
+        row = self.connection().execute(
+            "SELECT id, source_mtime_ns, source_size, record_count, question_count "
+            "FROM exams WHERE vendor = ? AND name = ?",
+            (vendor, name),
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "source_mtime_ns", "source_size", "record_count", "question_count")
+        return dict(zip(keys, row))
+
+    def summary(self, exam_id):
+        """
+        Question numbers, filenames, choice counts and vote consensus of the
+        quizzable questions, by quiz position
+        """
+        rows = self.connection().execute(
+            "SELECT question_number, filename, choice_count, consensus FROM questions "
+            "WHERE exam_id = ? AND quiz_position IS NOT NULL ORDER BY quiz_position",
+            (exam_id,),
+        ).fetchall()
+        return {
+            "question_count": len(rows),
+            "question_numbers": tuple(row[0] for row in rows),
+            "filenames": tuple(row[1] for row in rows),
+            "choice_counts": tuple(row[2] for row in rows),
+            "consensus": tuple(row[3] for row in rows),
+        }
+
+    def questions_at(self, exam_id, quiz_positions):
+        """
+        Quiz questions at the given quiz positions, in the given order
+        """
+        by_position = {}
+        connection = self.connection()
+        positions = sorted(set(quiz_positions))
+        # Stay below SQLite's bound-parameter limit.
+        for start in range(0, len(positions), 500):
+            chunk = positions[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for quiz_position, record in connection.execute(
+                f"SELECT quiz_position, record FROM questions WHERE exam_id = ? "
+                f"AND quiz_position IN ({placeholders})",
+                (exam_id, *chunk),
+            ):
+                by_position[quiz_position] = build_question(json.loads(record))
+        return [by_position[position] for position in quiz_positions]
+
+    def search(self, query, limit=20):
+        """
+        Quizzable questions matching every word of query, a word also
+        matching longer words it is a prefix of. Best matches first, as
+        dicts with vendor, exam, quiz_position, question_number and snippet.
+        """
+        terms = SEARCH_TERM.findall(query)
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+        rows = self.connection().execute(
+            "SELECT e.vendor, e.name, t.quiz_position, q.question_number, "
+            "snippet(question_text, -1, '**', '**', '...', 16) "
+            "FROM question_text t "
+            "JOIN exams e ON e.id = t.exam_id "
+            "JOIN questions q ON q.exam_id = t.exam_id AND q.quiz_position = t.quiz_position "
+            "WHERE question_text MATCH ? "
+            "ORDER BY bm25(question_text, 2.0, 1.0) LIMIT ?",
+            (match, limit),
+        ).fetchall()
+        keys = ("vendor", "exam", "quiz_position", "question_number", "snippet")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def records(self, exam_id):
+        """
+        Stream an exam's raw parsed records in file order
+        """
+        for (record,) in self.connection().execute(
+            "SELECT record FROM questions WHERE exam_id = ? ORDER BY position",
+            (exam_id,),
+        ):
+            yield json.loads(record)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Compile the questions directory into an indexed SQLite corpus"
+    )
+    arg_parser.add_argument("--questions-dir", default=QUESTIONS_DIR)
+    arg_parser.add_argument("--output", default=CORPUS_PATH)
+    args = arg_parser.parse_args()
+
+    compiled, unchanged, removed = build_corpus(args.questions_dir, args.output)
+    print(
+        f"Corpus saved to {args.output}: {compiled} exam(s) compiled, "
+        f"{unchanged} unchanged, {removed} removed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError
+
+from config import DEFAULT_RATE_LIMIT, HOST_RATE_LIMITS, MAX_BACKOFF, USER_AGENT
+from metrics import METRICS
+
+
+RATE_LIMITED_STATUSES = (429, 503)
+
+
+def parse_retry_after(value):
+    """
+    Retry-After is either a number of seconds or an HTTP date
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class TokenBucket:
+    """
+    Per-host request budget with additive-increase / multiplicative-decrease
+    backoff. A rate-limited response halves the rate and blocks the host for
+    Retry-After (or an exponential delay); each success wins back a tenth of
+    the configured rate.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 16
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = max(self.updated, now)
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+
+    def penalize(self, retry_after=None):
+        """
+        Back off after a rate-limited response; returns the block duration
+        """
+        self.failures += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        if retry_after is None:
+            retry_after = (2**self.failures) / self.rate * random.uniform(0.8, 1.2)
+        delay = min(MAX_BACKOFF, retry_after)
+
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + delay)
+        self.tokens = 0
+        self.updated = self.blocked_until
+        return delay
+
+    def reward(self):
+        self.failures = 0
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class Crawler:
+    """
+    Async crawl engine: blocking requests run in worker threads over one
+    pooled keep-alive session, and every request first takes a token from its
+    host's bucket, so concurrent jobs share one budget per host.
+    """
+
+    def __init__(
+        self,
+        rate_limits=None,
+        concurrency=8,
+        max_retries=5,
+        timeout=30,
+    ):
+        self.rate_limits = {**HOST_RATE_LIMITS, **(rate_limits or {})}
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.buckets = {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stats = {"requests": 0, "rate_limited": 0, "waited": 0.0}
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def bucket(self, host):
+        if host not in self.buckets:
+            rate, capacity = self.rate_limits.get(host, DEFAULT_RATE_LIMIT)
+            self.buckets[host] = TokenBucket(rate, capacity)
+        return self.buckets[host]
+
+    async def call(self, host, func, *args, **kwargs):
+        """
+        Run a blocking request function against host within its budget.
+
+        func must raise requests' HTTPError for error responses; 429/503 are
+        retried after backing off, anything else propagates.
+        """
+        bucket = self.bucket(host)
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            await bucket.acquire()
+            waited = time.monotonic() - started
+            self.stats["waited"] += waited
+            METRICS.observe("crawler_rate_limit_wait_seconds", waited, host=host)
+            try:
+                async with self.semaphore:
+                    self.stats["requests"] += 1
+                    with METRICS.timer("crawler_fetch_seconds", host=host):
+                        result = await asyncio.to_thread(func, *args, **kwargs)
+            except HTTPError as e:
+                response = e.response
+                if response is None or response.status_code not in RATE_LIMITED_STATUSES:
+                    raise
+                self.stats["rate_limited"] += 1
+                METRICS.inc("crawler_rate_limited_total", host=host, status=response.status_code)
+                if attempt == self.max_retries:
+                    raise
+                delay = bucket.penalize(
+                    parse_retry_after(response.headers.get("Retry-After"))
+                )
+                logging.warning(
+                    f"{host} answered {response.status_code}, backing off {delay:.0f}s"
+                )
+                continue
+            bucket.reward()
+            return result
+
+    def _get(self, url, **kwargs):
+        response = self.session.get(url, timeout=self.timeout, **kwargs)
+        if METRICS.enabled:
+            host = urlsplit(url).netloc
+            METRICS.inc("crawler_responses_total", host=host, status=response.status_code)
+            METRICS.inc("crawler_bytes_total", len(response.content), host=host)
+        response.raise_for_status()
+        return response
+
+    async def fetch(self, url, **kwargs):
+        return await self.call(urlsplit(url).netloc, self._get, url, **kwargs)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,194 @@
+import argparse
+import json
+import re
+import zlib
+
+import numpy as np
+
+from config import DUPLICATES_PATH, QUESTIONS_DIR
+from corpus import list_exam_files
+from utils import iter_json_array, question_number, write_json_atomic
+
+
+SHINGLE_WORDS = 3
+NUM_PERM = 128
+# 16 bands of 8 rows make pairs above ~0.7 Jaccard likely LSH candidates;
+# candidates are then checked against SIMILARITY_THRESHOLD.
+BANDS = 16
+SIMILARITY_THRESHOLD = 0.8
+
+# One seed per hash function; each function is splitmix64(shingle ^ seed).
+SEEDS = np.random.default_rng(1).integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+
+CHOICE_LETTER = re.compile(r"^[A-Z]\.")
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def record_text(record):
+    """
+    Question text plus choices, without the "A." choice prefixes
+    """
+    choices = [CHOICE_LETTER.sub("", choice) for choice in record.get("choices") or []]
+    return " ".join([record.get("question") or "", *choices])
+
+
+def shingles(text):
+    words = WORD.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = (" ".join(words[i : i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1))
+    return np.fromiter({zlib.crc32(gram.encode()) for gram in grams}, dtype=np.uint64)
+
+
+def splitmix64(values):
+    # uint64 arithmetic wraps, which is exactly what the mixer relies on
+    with np.errstate(over="ignore"):
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def minhash(text):
+    """
+    MinHash signature of a text, or None if it has no words
+    """
+    hashes = shingles(text)
+    if not len(hashes):
+        return None
+    return splitmix64(SEEDS[:, None] ^ hashes[None, :]).min(axis=1)
+
+
+def similar_pairs(signatures, threshold=SIMILARITY_THRESHOLD):
+    """
+    Pairs (i, j, similarity) of signatures whose estimated Jaccard similarity
+    is at least threshold, found via LSH banding instead of comparing all
+    pairs. signatures may contain None for empty documents.
+    """
+    rows = NUM_PERM // BANDS
+    candidates = set()
+    for band in range(BANDS):
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            if signature is not None:
+                key = signature[band * rows : (band + 1) * rows].tobytes()
+                buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            for index, i in enumerate(members):
+                for j in members[index + 1 :]:
+                    candidates.add((i, j))
+
+    pairs = []
+    for i, j in sorted(candidates):
+        similarity = float(np.mean(signatures[i] == signatures[j]))
+        if similarity >= threshold:
+            pairs.append((i, j, similarity))
+    return pairs
+
+
+def clusters_from_pairs(pairs):
+    """
+    Connected components (sorted index lists) of the pair graph
+    """
+    parent = {}
+
+    def find(i):
+        parent.setdefault(i, i)
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j, _ in pairs:
+        parent[find(i)] = find(j)
+
+    groups = {}
+    for i in parent:
+        groups.setdefault(find(i), []).append(i)
+    return sorted(sorted(members) for members in groups.values())
+
+
+def find_clusters(records, threshold=SIMILARITY_THRESHOLD):
+    signatures = [minhash(record_text(record)) for record in records]
+    return clusters_from_pairs(similar_pairs(signatures, threshold))
+
+
+def total_votes(record):
+    return sum(vote.get("vote_count", 0) for vote in record.get("user_data") or [])
+
+
+def collapse_duplicates(records, threshold=SIMILARITY_THRESHOLD):
+    """
+    Keep one record per near-duplicate cluster, the one with the most votes.
+    Returns (kept records in their original order, number dropped).
+    """
+    dropped = set()
+    for members in find_clusters(records, threshold):
+        keep = max(members, key=lambda i: (total_votes(records[i]), -i))
+        dropped.update(i for i in members if i != keep)
+    return [record for i, record in enumerate(records) if i not in dropped], len(dropped)
+
+
+def build_duplicate_index(questions_dir=QUESTIONS_DIR, threshold=SIMILARITY_THRESHOLD):
+    """
+    Near-duplicate clusters across every exam. Only signatures are kept in
+    memory, records are streamed.
+    """
+    members, signatures = [], []
+    for vendor, name, path in list_exam_files(questions_dir):
+        with open(path, "r") as file:
+            for record in iter_json_array(file):
+                filename = record.get("filename") or ""
+                members.append(
+                    {
+                        "exam": f"{vendor}/{name}",
+                        "filename": filename,
+                        "question_number": question_number(filename),
+                    }
+                )
+                signatures.append(minhash(record_text(record)))
+
+    pairs = similar_pairs(signatures, threshold)
+    return [[members[i] for i in cluster] for cluster in clusters_from_pairs(pairs)]
+
+
+def load_exam_clusters(exam, duplicates_path=DUPLICATES_PATH):
+    """
+    {filename: cluster id} for the questions of one exam ("vendor/name")
+    that have a near-duplicate in the same exam
+    """
+    try:
+        with open(duplicates_path, "r", encoding="utf-8") as file:
+            clusters = json.load(file)
+    except FileNotFoundError:
+        return {}
+
+    exam_clusters = {}
+    for cluster_id, cluster in enumerate(clusters):
+        filenames = [member["filename"] for member in cluster if member["exam"] == exam]
+        if len(filenames) > 1:
+            exam_clusters.update(dict.fromkeys(filenames, cluster_id))
+    return exam_clusters
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Find near-duplicate questions across every exam with MinHash/LSH"
+    )
+    arg_parser.add_argument("--questions-dir", default=QUESTIONS_DIR)
+    arg_parser.add_argument("--output", default=DUPLICATES_PATH)
+    arg_parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+    args = arg_parser.parse_args()
+
+    clusters = build_duplicate_index(args.questions_dir, args.threshold)
+    write_json_atomic(args.output, clusters, indent=4)
+
+    cross_exam = sum(len({member["exam"] for member in cluster}) > 1 for cluster in clusters)
+    print(
+        f"Found {len(clusters)} duplicate cluster(s) ({cross_exam} spanning exams, "
+        f"{sum(map(len, clusters))} questions). Saved to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
-import os
-import requests
-from googlesearch import search
-import time
-import random
-import logging
-from requests.exceptions import HTTPError
+import argparse
+import asyncio
 import json
+import logging
+
+from crawler import Crawler
+from metrics import METRICS
+from page_store import content_digest, open_page_store
+from resolver import UrlResolver
+from utils import write_json_atomic
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,87 +15,213 @@ logging.basicConfig(
     handlers=[logging.FileHandler("logfile.log"), logging.StreamHandler()],
 )
 
+# Exams to crawl. Jobs run concurrently but share one request budget per host.
+# With discussion_index and exam_slug set, discussion URLs are harvested from
+# the vendor's listing pages and search is only used for questions not found.
+EXAMS = [
+    {
+        "base_query": "Databricks Certified Data Engineer Associate Examtopics question",
+        "exam": "Databricks/data_engineer_associate",
+        "number_of_questions": 148,
+        "discussion_index": "https://www.examtopics.com/discussions/databricks/",
+        "exam_slug": "certified-data-engineer-associate",
+    },
+]
 
-def save_webpage_content(url, file_path):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
-    }
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        with open(file_path, "wb") as file:
-            file.write(response.content)
-        logging.info(f"Saved webpage from {url} as {file_path}")
-    except Exception as e:
-        logging.error(f"Failed to download from {url}: {e}")
 
+FETCH_MANIFEST_NAME = ".fetch_manifest.json"
 
-def download_first_search_result(query, save_directory):
-    logging.info(f"Searching for: {query}")
-    try:
-        search_results = search(query, num_results=1)
-        first_result_url = next(iter(search_results), None)
-
-        if first_result_url:
-            file_name = f"result_{query}.html"
-            file_path = os.path.join(save_directory, file_name)
-            logging.info(f"Downloading from: {first_result_url}")
-            save_webpage_content(first_result_url, file_path)
-            logging.info(f"Saved as: {file_path}")
-        else:
-            logging.warning(f"No search results found for query: {query}")
-    except HTTPError as e:
-        if e.response.status_code == 429:
-            logging.error("Rate limit exceeded. Sleeping for 1 hour.")
-            time.sleep(3600)
-            raise
-        else:
-            logging.error(f"HTTP error occurred: {e}")
-    except Exception as e:
-        logging.error(f"An error occurred during search: {e}")
-
-    logging.info("Sleeping")
-    time.sleep(random.uniform(41, 50))
-    logging.info("Woke up")
-
-
-def save_progress(current_question):
-    with open("progress.json", "w") as f:
-        json.dump({"last_completed": current_question}, f)
-
-
-def load_progress():
-    try:
-        with open("progress.json", "r") as f:
-            return json.load(f)["last_completed"]
-    except FileNotFoundError:
-        return 0
 
+def page_filename(query):
+    return f"result_{query}.html"
 
-def main():
-    base_query = "Databricks Certified Data Engineer Associate Examtopics question"
-    save_directory = "./html_pages/Databricks/data_engineer_associate"
-    number_of_questions = 148
 
-    os.makedirs(save_directory, exist_ok=True)
+class FetchManifest:
+    """
+    Per-exam record of each saved page's URL, response validators
+    (ETag / Last-Modified) and content hash, used for conditional re-fetches
+    """
 
-    # start_from = load_progress()
-    start_from = 135
-    logging.info(f"Resuming from question {start_from + 1}")
+    def __init__(self, store, exam):
+        self.path = store.manifest_path(exam, FETCH_MANIFEST_NAME)
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.pages = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.pages = {}
+
+    def conditional_headers(self, filename):
+        entry = self.pages.get(filename, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, filename, url, response, digest):
+        entry = self.pages.setdefault(filename, {})
+        entry["url"] = url
+        entry["sha256"] = digest
+        for key, header in (("etag", "ETag"), ("last_modified", "Last-Modified")):
+            if response.headers.get(header):
+                entry[key] = response.headers[header]
+
+    def save(self):
+        write_json_atomic(self.path, self.pages, indent=4, sort_keys=True)
+
+
+def save_webpage_content(response, store, exam, filename, manifest):
+    """
+    Write the page through the page store unless it is unchanged; returns
+    True if it was written.
+
+    Unchanged pages are not touched, so the incremental parser skips them.
+    """
+    if response.status_code == 304:
+        logging.info(f"Not modified: {exam}/{filename}")
+        return False
+
+    digest = content_digest(response.content)
+    manifest.update(filename, response.url, response, digest)
+    # The store compares against what it holds, so a page deleted from it
+    # is written again even if the manifest knows its content
+    if not store.write(exam, filename, response.content):
+        logging.info(f"Unchanged content: {exam}/{filename}")
+        return False
+
+    logging.info(f"Saved webpage from {response.url} as {exam}/{filename}")
+    return True
+
+
+async def download_question(crawler, resolver, store, manifest, exam, query, refresh=False):
+    filename = page_filename(query)
+    exists = store.exists(exam, filename)
+    if exists and not refresh:
+        logging.info(f"Already downloaded: {exam}/{filename}")
+        return False
+
+    url = manifest.pages.get(filename, {}).get("url") or await resolver.resolve(query)
+    if not url:
+        logging.warning(f"No search results found for query: {query}")
+        return False
+
+    logging.info(f"Downloading from: {url}")
+    headers = manifest.conditional_headers(filename) if exists else {}
+    response = await crawler.fetch(url, headers=headers)
+    return save_webpage_content(response, store, exam, filename, manifest)
+
+
+async def crawl_exam(
+    crawler,
+    resolver,
+    store,
+    base_query,
+    exam,
+    number_of_questions,
+    discussion_index=None,
+    exam_slug=None,
+    topic=None,
+    refresh=False,
+    on_page=None,
+):
+    """
+    Download every question of one exam. With refresh=True only pages that
+    are already saved are revisited, using conditional GETs. on_page(exam,
+    filename) is called for every page written, as soon as it is written.
+    """
+    manifest = FetchManifest(store, exam)
+    queries = {
+        i: f"{base_query} {i} discussion" for i in range(1, number_of_questions + 1)
+    }
+    saved = {i for i, query in queries.items() if store.exists(exam, page_filename(query))}
+    if refresh:
+        queries = {i: query for i, query in queries.items() if i in saved}
+        # Refreshed pages reuse the URL recorded in the fetch manifest
+        to_resolve = {
+            i: query
+            for i, query in queries.items()
+            if not manifest.pages.get(page_filename(query), {}).get("url")
+        }
+    else:
+        to_resolve = {i: query for i, query in queries.items() if i not in saved}
+
+    if discussion_index and exam_slug and to_resolve:
+        try:
+            await resolver.harvest(discussion_index, exam_slug, to_resolve, topic)
+        except Exception as e:
+            logging.error(f"Harvesting {discussion_index} failed: {e}")
 
-    for i in range(start_from + 1, number_of_questions + 1):
-        query = f"{base_query} {i} discussion"
+    async def download(i):
         try:
-            download_first_search_result(query, save_directory)
-            save_progress(i)
-        except HTTPError as e:
-            if e.response.status_code == 429:
-                logging.info(f"Rate limit hit. Stopping at question {i}.")
-                break
-            else:
-                logging.error(f"HTTP error for question {i}: {e}")
+            written = await download_question(
+                crawler, resolver, store, manifest, exam, queries[i], refresh
+            )
         except Exception as e:
-            logging.error(f"Error processing question {i}: {e}")
+            logging.error(f"Error processing question {i} of {base_query}: {e}")
+            return False
+        if written and on_page:
+            on_page(exam, page_filename(queries[i]))
+        return written
+
+    try:
+        written = await asyncio.gather(*(download(i) for i in queries))
+    finally:
+        store.flush()
+        manifest.save()
+    logging.info(f"{exam}: {sum(written)} of {len(queries)} page(s) written")
+
+
+async def crawl_exams(exams, refresh=False, store=None, on_page=None, **crawler_options):
+    crawler = Crawler(**crawler_options)
+    resolver = UrlResolver(crawler)
+    store = store or open_page_store()
+    try:
+        await asyncio.gather(
+            *(
+                crawl_exam(
+                    crawler, resolver, store, refresh=refresh, on_page=on_page, **exam
+                )
+                for exam in exams
+            )
+        )
+    finally:
+        crawler.close()
+    logging.info(
+        f"Crawl finished: {crawler.stats['requests']} requests, "
+        f"{resolver.stats['searches']} searches, "
+        f"{resolver.stats['harvested']} harvested and "
+        f"{resolver.stats['hits']} cached URLs, "
+        f"{crawler.stats['rate_limited']} rate limited, "
+        f"{crawler.stats['waited']:.0f}s waiting for rate limits"
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Download ExamTopics pages")
+    arg_parser.add_argument(
+        "--concurrency", type=int, default=8, help="Requests in flight at once"
+    )
+    arg_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Re-fetch already saved pages with conditional GETs, e.g. for vote tallies",
+    )
+    arg_parser.add_argument(
+        "--metrics",
+        help="Record fetch metrics and save them to this file (.prom for Prometheus text, else JSON)",
+    )
+    args = arg_parser.parse_args()
+    METRICS.enable(bool(args.metrics))
+
+    try:
+        asyncio.run(
+            crawl_exams(EXAMS, refresh=args.refresh, concurrency=args.concurrency)
+        )
+    finally:
+        if args.metrics:
+            METRICS.write(args.metrics)
+            logging.info(f"Metrics saved to {args.metrics}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils import write_json_atomic
+
+
+PREFIX = "examtopics_"
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "started")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    """
+    In-process counters and timers.
+
+    Disabled by default: every call then returns right away and timer()
+    hands out one shared no-op context manager, so instrumented hot paths
+    cost a method call. Timers keep count, sum and max per name and label
+    set, not individual samples.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self.lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    def timer(self, name, **labels):
+        """
+        Context manager that observes its block's wall time
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def snapshot(self, reset=False):
+        """
+        JSON-serializable copy of every metric; reset=True also clears them
+        """
+        with self.lock:
+            counters, timers = self.counters, self.timers
+            if reset:
+                self.counters, self.timers = {}, {}
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(counters.items())
+                ],
+                "timers": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "count": count,
+                        "sum": total,
+                        "max": longest,
+                    }
+                    for (name, labels), (count, total, longest) in sorted(timers.items())
+                ],
+            }
+
+    def merge(self, snapshot):
+        """
+        Add a snapshot taken in another process, e.g. a parser worker
+        """
+        for counter in snapshot["counters"]:
+            self.inc(counter["name"], counter["value"], **counter["labels"])
+        with self.lock:
+            for timer in snapshot["timers"]:
+                key = _key(timer["name"], timer["labels"])
+                current = self.timers.setdefault(key, [0, 0.0, 0.0])
+                current[0] += timer["count"]
+                current[1] += timer["sum"]
+                current[2] = max(current[2], timer["max"])
+
+    def prometheus_text(self):
+        families = {}
+        snapshot = self.snapshot()
+        for counter in snapshot["counters"]:
+            name = PREFIX + counter["name"]
+            families.setdefault((name, "counter"), []).append(
+                f"{name}{_labels(counter['labels'])} {counter['value']}"
+            )
+        for timer in snapshot["timers"]:
+            name = PREFIX + timer["name"]
+            labels = _labels(timer["labels"])
+            families.setdefault((name, "summary"), []).extend(
+                [
+                    f"{name}_count{labels} {timer['count']}",
+                    f"{name}_sum{labels} {timer['sum']:.6f}",
+                ]
+            )
+            families.setdefault((f"{name}_max", "gauge"), []).append(
+                f"{name}_max{labels} {timer['max']:.6f}"
+            )
+
+        lines = []
+        for (name, kind), samples in families.items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Save the metrics to path: Prometheus text for .prom files, JSON
+        otherwise
+        """
+        if path.endswith(".prom"):
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(self.prometheus_text())
+        else:
+            write_json_atomic(path, self.snapshot(), indent=4)
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve Prometheus text on http://host:port/metrics from a daemon thread
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{json.dumps(str(value))[1:-1]}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+# The process-wide registry every module reports to.
+METRICS = Registry()
@@ -0,0 +1,206 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+from config import HTML_PAGES_DIR, PAGE_STORE, PAGE_STORE_DIR
+from utils import question_number, question_sort_key, write_json_atomic
+
+
+def content_digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+class DirectoryPageStore:
+    """
+    Loose .html files, one directory per exam (the original html_pages layout)
+    """
+
+    def __init__(self, root=HTML_PAGES_DIR):
+        self.root = root
+
+    def exam_dir(self, exam):
+        return os.path.join(self.root, exam)
+
+    def manifest_path(self, exam, name):
+        return os.path.join(self.exam_dir(exam), name)
+
+    def list_pages(self, exam):
+        try:
+            filenames = os.listdir(self.exam_dir(exam))
+        except FileNotFoundError:
+            return []
+        return sorted((f for f in filenames if f.endswith(".html")), key=question_sort_key)
+
+    def exists(self, exam, filename):
+        return os.path.exists(os.path.join(self.exam_dir(exam), filename))
+
+    def stat(self, exam, filename):
+        """
+        Cheap change marker; equal stats mean the content is unchanged
+        """
+        stat = os.stat(os.path.join(self.exam_dir(exam), filename))
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def digest(self, exam, filename):
+        return content_digest(self.read(exam, filename))
+
+    def read(self, exam, filename):
+        with open(os.path.join(self.exam_dir(exam), filename), "rb") as file:
+            return file.read()
+
+    def write(self, exam, filename, content):
+        """
+        Store a page; returns False if the stored content was already identical
+        """
+        if self.exists(exam, filename) and self.digest(exam, filename) == content_digest(
+            content
+        ):
+            return False
+        os.makedirs(self.exam_dir(exam), exist_ok=True)
+        with open(os.path.join(self.exam_dir(exam), filename), "wb") as file:
+            file.write(content)
+        return True
+
+    def flush(self):
+        pass
+
+    def reload(self, exam):
+        pass
+
+
+class BlobPageStore:
+    """
+    Gzip-compressed, content-addressed page blobs plus one small JSON index
+    per exam mapping filename -> question number and blob digest.
+
+    Identical pages saved under different queries or exams share one blob.
+    Index changes are buffered until flush().
+    """
+
+    def __init__(self, root=PAGE_STORE_DIR):
+        self.root = root
+        self.indexes = {}
+        self.dirty = set()
+
+    def __getstate__(self):
+        # Pool workers only need the root; they load indexes on demand.
+        return {"root": self.root, "indexes": {}, "dirty": set()}
+
+    def index_path(self, exam):
+        return os.path.join(self.root, "index", f"{exam}.json")
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}.html.gz")
+
+    def manifest_path(self, exam, name):
+        return os.path.join(self.root, "manifests", exam, name)
+
+    def index(self, exam):
+        if exam not in self.indexes:
+            try:
+                with open(self.index_path(exam), "r", encoding="utf-8") as file:
+                    self.indexes[exam] = json.load(file)
+            except FileNotFoundError:
+                self.indexes[exam] = {}
+        return self.indexes[exam]
+
+    def list_pages(self, exam):
+        return sorted(self.index(exam), key=question_sort_key)
+
+    def pages_by_question(self, exam):
+        return {
+            entry["question"]: filename
+            for filename, entry in self.index(exam).items()
+            if entry["question"] is not None
+        }
+
+    def exists(self, exam, filename):
+        return filename in self.index(exam)
+
+    def stat(self, exam, filename):
+        return {"sha256": self.index(exam)[filename]["sha256"]}
+
+    def digest(self, exam, filename):
+        return self.index(exam)[filename]["sha256"]
+
+    def read(self, exam, filename):
+        with open(self.blob_path(self.digest(exam, filename)), "rb") as file:
+            return gzip.decompress(file.read())
+
+    def write(self, exam, filename, content):
+        digest = content_digest(content)
+        index = self.index(exam)
+        if index.get(filename, {}).get("sha256") == digest:
+            return False
+
+        blob_path = self.blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path))
+            with os.fdopen(fd, "wb") as file:
+                file.write(gzip.compress(content, mtime=0))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, blob_path)
+
+        index[filename] = {
+            "question": question_number(filename),
+            "sha256": digest,
+            "size": len(content),
+        }
+        self.dirty.add(exam)
+        return True
+
+    def flush(self):
+        for exam in sorted(self.dirty):
+            write_json_atomic(self.index_path(exam), self.index(exam), indent=4)
+        self.dirty.clear()
+
+    def reload(self, exam):
+        """
+        Drop the cached index of an exam so pages another process flushed
+        since are seen; unflushed changes of this store are kept
+        """
+        if exam not in self.dirty:
+            self.indexes.pop(exam, None)
+
+
+PAGE_STORES = {"directory": DirectoryPageStore, "blob": BlobPageStore}
+
+
+def open_page_store(kind=PAGE_STORE, root=None):
+    store_class = PAGE_STORES[kind]
+    return store_class(root) if root else store_class()
+
+
+def import_pages(source, target, exams):
+    """
+    Copy every page of the given exams from one store into another
+    """
+    copied = 0
+    for exam in exams:
+        for filename in source.list_pages(exam):
+            copied += target.write(exam, filename, source.read(exam, filename))
+    target.flush()
+    return copied
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Import loose html_pages into the compressed page store"
+    )
+    arg_parser.add_argument("exams", nargs="+", help="Exam paths, e.g. AWS/data_engineer_associate")
+    arg_parser.add_argument("--source", default=HTML_PAGES_DIR)
+    arg_parser.add_argument("--target", default=PAGE_STORE_DIR)
+    args = arg_parser.parse_args()
+
+    copied = import_pages(
+        DirectoryPageStore(args.source), BlobPageStore(args.target), args.exams
+    )
+    print(f"Imported {copied} page(s) into {args.target}")
+
+
+if __name__ == "__main__":
+    main()
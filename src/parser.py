@@ -1,20 +1,27 @@
 from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import argparse
 import os
+import re
 import json
 import chardet
 import html
+import io
 import unicodedata
 
+from config import PAGE_STORE
+from metrics import METRICS
+from page_store import PAGE_STORES, DirectoryPageStore, open_page_store
+from utils import question_sort_key, write_json_atomic
 
-PATH_EXAM = "Databricks/data_engineer_associate"
-html_dir = f"./html_pages/{PATH_EXAM}"
-extracted_data = []
 
+PATH_EXAM = "Databricks/data_engineer_associate"
 
-def detect_encoding(file_path):
-    with open(file_path, "rb") as file:
-        raw_data = file.read()
-    return chardet.detect(raw_data)["encoding"]
+# Bump whenever extraction output or the manifest layout changes so incremental runs re-parse
+# every page instead of trusting records cached in the manifest.
+PARSER_VERSION = 4
+MANIFEST_NAME = ".parse_manifest.json"
 
 
 def normalize_text(text):
@@ -26,23 +33,123 @@ def normalize_text(text):
     return text
 
 
-for filename in os.listdir(html_dir):
-    if filename.endswith(".html"):
-        file_path = os.path.join(html_dir, filename)
-        encoding = detect_encoding(file_path)
+# Joining with NUL is safe: no entity unescapes to it and, being a starter
+# character, NFKD never reorders combining marks across it.
+NORMALIZE_SEPARATOR = "\x00"
 
-        try:
-            with open(file_path, "r", encoding=encoding) as file:
-                html_content = file.read()
-        except UnicodeDecodeError:
-            print(
-                f"Failed to decode {filename} with detected encoding {encoding}. Skipping this file."
-            )
+
+def normalize_texts(texts):
+    """
+    Batched normalize_text: one unescape/NFKD/encode pass for a whole page
+    """
+    present = [text for text in texts if text is not None]
+    if not present or any(NORMALIZE_SEPARATOR in text for text in present):
+        return [normalize_text(text) for text in texts]
+
+    normalized = iter(
+        normalize_text(NORMALIZE_SEPARATOR.join(present)).split(NORMALIZE_SEPARATOR)
+    )
+    return [next(normalized) if text is not None else None for text in texts]
+
+
+EXTRACTION_MODES = ("fast", "full")
+
+# The only parts of a discussion page the parser reads, as (tag, class) pairs.
+REGIONS = {
+    "question": ("div", "question-body"),
+    "choices": ("div", "question-choices-container"),
+    "correct_answer": ("span", "correct-answer"),
+    "user_data": ("div", "voted-answers-tally"),
+}
+
+# Comments and script/style contents are not markup, so tags in them (e.g.
+# "</div>" in a string literal) must not open, close or start a region.
+SKIPPED_TEXT = r"<!--.*?(?:-->|\Z)|<(?P<raw>script|style)\b[^>]*>.*?(?:</(?P=raw)\s*>|\Z)"
+
+REGION_START_PATTERNS = {
+    name: re.compile(
+        rf"{SKIPPED_TEXT}|(?P<start><{tag}\b[^>]*?\bclass\s*=\s*[\"']?[^\"'>]*?"
+        rf"(?<![\w-]){re.escape(class_name)}(?![\w-]))",
+        re.IGNORECASE | re.DOTALL,
+    )
+    for name, (tag, class_name) in REGIONS.items()
+}
+
+TAG_PATTERNS = {
+    tag: re.compile(rf"{SKIPPED_TEXT}|<(?P<close>/?){tag}\b[^>]*>", re.IGNORECASE | re.DOTALL)
+    for tag, _ in REGIONS.values()
+}
+
+
+def _region_span(html_content, name):
+    start = next(
+        (
+            match.start()
+            for match in REGION_START_PATTERNS[name].finditer(html_content)
+            if match.group("start")
+        ),
+        None,
+    )
+    if start is None:
+        return None
+
+    tag, _ = REGIONS[name]
+    depth = 0
+    for tag_match in TAG_PATTERNS[tag].finditer(html_content, start):
+        if tag_match.group("close") is None:
             continue
+        if tag_match.group("close"):
+            depth -= 1
+        elif not tag_match.group(0).endswith("/>"):
+            depth += 1
+        if depth == 0:
+            return start, tag_match.end()
+    return start, len(html_content)
+
+
+def _region_soups(html_content):
+    """
+    Build small soups for just the page regions the extractor reads.
 
-        soup = BeautifulSoup(html_content, "html.parser")
+    Regions nested in an already parsed region (the choices and the vote
+    tally usually sit inside question-body) reuse that region's soup.
+    """
+    spans = {name: _region_span(html_content, name) for name in REGIONS}
+
+    parsed = []
+    for span in sorted({span for span in spans.values() if span}):
+        if parsed and span[1] <= parsed[-1][0][1]:
+            continue
+        region = html_content[span[0] : span[1]]
+        parsed.append((span, BeautifulSoup(region, "html.parser")))
 
-        question_div = soup.find("div", class_="question-body")
+    roots = {}
+    for name, span in spans.items():
+        roots[name] = next(
+            (
+                soup
+                for (start, end), soup in parsed
+                if span and start <= span[0] and span[1] <= end
+            ),
+            None,
+        )
+    return roots
+
+
+def _find(root, *args, **kwargs):
+    return root.find(*args, **kwargs) if root is not None else None
+
+
+def extract_question_data(html_content, filename, extraction="fast"):
+    with METRICS.timer("parser_stage_seconds", stage="parse"):
+        if extraction == "full":
+            soup = BeautifulSoup(html_content, "html.parser")
+            roots = dict.fromkeys(REGIONS, soup)
+        else:
+            roots = _region_soups(html_content)
+
+    with METRICS.timer("parser_stage_seconds", stage="extraction"):
+        question_div = _find(roots["question"], "div", class_="question-body")
         question = (
             question_div.find("p", class_="card-text").get_text(strip=True)
             if question_div
@@ -50,39 +157,383 @@ for filename in os.listdir(html_dir):
         )
 
         choices = []
-        choices_div = soup.find("div", class_="question-choices-container")
+        choices_div = _find(roots["choices"], "div", class_="question-choices-container")
         if choices_div:
             list_items = choices_div.find_all("li", class_="multi-choice-item")
             choices = [item.get_text(strip=True) for item in list_items]
 
-        correct_answer_span = soup.find("span", class_="correct-answer")
+        correct_answer_span = _find(roots["correct_answer"], "span", class_="correct-answer")
         correct_answer = (
             correct_answer_span.get_text(strip=True) if correct_answer_span else None
         )
 
-        voted_answers_div = soup.find("div", class_="voted-answers-tally d-none")
+        voted_answers_div = _find(
+            roots["user_data"], "div", class_="voted-answers-tally d-none"
+        )
         user_data = None
         if voted_answers_div:
             script_tag = voted_answers_div.find("script", type="application/json")
             if script_tag:
                 user_data = json.loads(script_tag.string)
 
-        question = normalize_text(question)
-        choices = [normalize_text(choice) for choice in choices]
-        correct_answer = normalize_text(correct_answer)
+    with METRICS.timer("parser_stage_seconds", stage="normalization"):
+        if extraction == "full":
+            question = normalize_text(question)
+            choices = [normalize_text(choice) for choice in choices]
+            correct_answer = normalize_text(correct_answer)
+        else:
+            question, correct_answer, *choices = normalize_texts(
+                [question, correct_answer, *choices]
+            )
+
+    return {
+        "filename": filename,
+        "question": question,
+        "choices": choices,
+        "correct_answer": correct_answer,
+        "user_data": user_data,
+    }
+
+
+def decode_html(raw_data, filename, extraction="fast"):
+    with METRICS.timer("parser_stage_seconds", stage="decode"):
+        return _decode_html(raw_data, filename, extraction)
+
+
+def _decode_html(raw_data, filename, extraction):
+    if extraction == "fast":
+        # Nearly every saved page is UTF-8; only run chardet over the whole
+        # file when a strict decode fails.
+        try:
+            html_content = raw_data.decode("utf-8")
+        except UnicodeDecodeError:
+            html_content = None
+        if html_content is not None:
+            return html_content.replace("\r\n", "\n").replace("\r", "\n")
+
+    encoding = chardet.detect(raw_data)["encoding"]
+    try:
+        with io.TextIOWrapper(io.BytesIO(raw_data), encoding=encoding) as text:
+            return text.read()
+    except UnicodeDecodeError:
+        raise ValueError(
+            f"Failed to decode {filename} with detected encoding {encoding}"
+        )
+
+
+def read_html(file_path, extraction="fast"):
+    with open(file_path, "rb") as file:
+        raw_data = file.read()
+    return decode_html(raw_data, os.path.basename(file_path), extraction)
+
+
+def parse_file(file_path, extraction="fast"):
+    html_content = read_html(file_path, extraction)
+    return extract_question_data(
+        html_content, os.path.basename(file_path), extraction
+    )
+
+
+def parse_page(raw_data, filename, extraction="fast"):
+    html_content = decode_html(raw_data, filename, extraction)
+    return extract_question_data(html_content, filename, extraction)
+
+
+# Page store of the current pool worker, set once per process so tasks only
+# carry (exam, filename).
+_worker_store = None
+_worker_sends_metrics = False
+
+
+def _init_worker(store, metrics_enabled=None):
+    # metrics_enabled is only passed to pool processes, which send their
+    # metrics back with each result.
+    global _worker_store, _worker_sends_metrics
+    _worker_store = store
+    _worker_sends_metrics = bool(metrics_enabled)
+    if metrics_enabled is not None:
+        METRICS.enable(metrics_enabled)
+
+
+def _parse_worker(page, extraction="fast"):
+    # Runs inside a pool process: errors are reported back instead of raised so
+    # one broken page never takes the whole batch down.
+    exam, filename = page
+    try:
+        with METRICS.timer("parser_page_seconds"):
+            result = parse_page(_worker_store.read(exam, filename), filename, extraction), None
+    except Exception as e:
+        METRICS.inc("parser_errors_total")
+        result = None, f"[pid {os.getpid()}] {filename}: {e}"
+    if _worker_sends_metrics:
+        return (*result, METRICS.snapshot(reset=True))
+    return result
+
+
+def parse_pages(store, exam, filenames, workers=None, extraction="fast"):
+    """
+    Parse the given pages of one exam, streamed out of store, across a
+    process pool. Returns (records, errors) in the order of filenames.
+    """
+    workers = workers or os.cpu_count() or 1
+    worker = partial(_parse_worker, extraction=extraction)
+    pages = [(exam, filename) for filename in filenames]
+
+    if workers == 1 or len(pages) < 2:
+        _init_worker(store)
+        results = [worker(page) for page in pages]
+    else:
+        chunksize = max(1, len(pages) // (workers * 4))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(store, METRICS.enabled),
+        ) as executor:
+            results = []
+            for record, error, *worker_metrics in executor.map(
+                worker, pages, chunksize=chunksize
+            ):
+                if worker_metrics:
+                    METRICS.merge(worker_metrics[0])
+                results.append((record, error))
+
+    records = [record for record, error in results if error is None]
+    errors = [error for record, error in results if error is not None]
+    return records, errors
+
+
+def parse_exam(store, exam, workers=None, extraction="fast"):
+    """
+    Parse every page of an exam. Records are ordered by question number, so
+    the output does not depend on listing order or on which worker finished
+    first.
+    """
+    return parse_pages(store, exam, store.list_pages(exam), workers, extraction)
+
+
+def parse_directory(html_dir, workers=None, extraction="fast"):
+    """
+    Parse every .html page in html_dir across a process pool.
+
+    Returns (records, errors).
+    """
+    return parse_exam(DirectoryPageStore(html_dir), "", workers, extraction)
+
+
+def load_manifest(manifest_path, extraction):
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+    if (
+        manifest.get("parser_version") != PARSER_VERSION
+        or manifest.get("extraction") != extraction
+    ):
+        return {}
+    return manifest.get("files", {})
+
+
+def load_existing_records(output_file):
+    try:
+        with open(output_file, "r", encoding="utf-8") as file:
+            return {record["filename"]: record for record in json.load(file)}
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def parse_incremental(
+    store,
+    exam,
+    output_file,
+    manifest_path=None,
+    workers=None,
+    extraction="fast",
+    full=False,
+    dedup=False,
+):
+    """
+    Re-parse only new or changed pages and merge them into output_file.
+
+    The manifest stores each page's store stat (size and mtime for loose
+    files, the blob digest for the blob store), content hash and parsed
+    record. Pages whose stat is unchanged are not even hashed; pages that are
+    hashed but identical reuse their cached record. Records of pages that no
+    longer exist are dropped. full=True ignores the manifest and re-parses
+    everything. dedup=True collapses near-duplicate questions in the output to
+    the most-voted one; the manifest keeps every page.
+
+    Returns (records, errors, stats).
+    """
+    manifest_path = manifest_path or store.manifest_path(exam, MANIFEST_NAME)
+    cached_files = {} if full else load_manifest(manifest_path, extraction)
+    existing_records = {} if full else load_existing_records(output_file)
+
+    entries = {}
+    to_parse = []
+    for filename in store.list_pages(exam):
+        cached = cached_files.get(filename)
+        entry = {"stat": store.stat(exam, filename)}
+
+        if cached and cached["stat"] == entry["stat"]:
+            entry["sha256"] = cached["sha256"]
+        else:
+            entry["sha256"] = store.digest(exam, filename)
+
+        if cached and cached["sha256"] == entry["sha256"]:
+            entry["record"] = existing_records.get(filename, cached["record"])
+        else:
+            to_parse.append(filename)
+        entries[filename] = entry
+
+    parsed, errors = parse_pages(store, exam, to_parse, workers, extraction)
+    for record in parsed:
+        entries[record["filename"]]["record"] = record
+
+    # Pages that failed to parse stay out of the manifest so the next run
+    # retries them.
+    entries = {name: entry for name, entry in entries.items() if "record" in entry}
+    records = [entry["record"] for entry in entries.values()]
+    duplicates = 0
+    if dedup:
+        from dedup import collapse_duplicates
+
+        records, duplicates = collapse_duplicates(records)
+
+    write_json_atomic(output_file, records, indent=4, ensure_ascii=True)
+    write_json_atomic(
+        manifest_path,
+        {
+            "parser_version": PARSER_VERSION,
+            "extraction": extraction,
+            "files": entries,
+        },
+    )
+
+    stats = {
+        "parsed": len(parsed),
+        "reused": len(entries) - len(parsed),
+        "removed": len(set(cached_files) - set(entries)),
+        "duplicates": duplicates,
+    }
+    return records, errors, stats
+
+
+def verify_exam(store, exam, workers=None):
+    """
+    Golden-output check: parse an exam with both extraction modes and return
+    the filenames whose records differ.
+    """
+    fast, _ = parse_exam(store, exam, workers, extraction="fast")
+    full, _ = parse_exam(store, exam, workers, extraction="full")
+    fast_by_file = {record["filename"]: record for record in fast}
+    full_by_file = {record["filename"]: record for record in full}
+
+    return sorted(
+        set(fast_by_file) ^ set(full_by_file)
+        | {
+            filename
+            for filename in fast_by_file.keys() & full_by_file.keys()
+            if fast_by_file[filename] != full_by_file[filename]
+        },
+        key=question_sort_key,
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Extract question data from saved ExamTopics pages"
+    )
+    arg_parser.add_argument(
+        "--exam", default=PATH_EXAM, help="Exam path, e.g. AWS/data_engineer_associate"
+    )
+    arg_parser.add_argument(
+        "--html-dir", help="Read loose .html pages from this directory instead of the page store"
+    )
+    arg_parser.add_argument(
+        "--store",
+        choices=sorted(PAGE_STORES),
+        default=PAGE_STORE,
+        help="Page store to read from (default: config.PAGE_STORE)",
+    )
+    arg_parser.add_argument(
+        "--output", help="Output JSON file (default: ./questions/<exam>_test.json)"
+    )
+    arg_parser.add_argument(
+        "--workers", type=int, default=None, help="Parser processes (default: CPU count)"
+    )
+    arg_parser.add_argument(
+        "--extraction",
+        choices=EXTRACTION_MODES,
+        default="fast",
+        help="fast parses only the question regions, full builds the whole page",
+    )
+    arg_parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Compare fast and full extraction on every page instead of writing output",
+    )
+    arg_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-parse every page and rewrite the output instead of updating it",
+    )
+    arg_parser.add_argument(
+        "--manifest",
+        help=f"Incremental parse manifest (default: {MANIFEST_NAME} in the page store)",
+    )
+    arg_parser.add_argument(
+        "--metrics",
+        help="Record parser timings and save them to this file (.prom for Prometheus text, else JSON)",
+    )
+    arg_parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Keep only the most-voted question of each near-duplicate cluster",
+    )
+    args = arg_parser.parse_args()
+    METRICS.enable(bool(args.metrics))
+
+    if args.html_dir:
+        store, exam = DirectoryPageStore(args.html_dir), ""
+    else:
+        store, exam = open_page_store(args.store), args.exam
+    output_file = args.output or f"./questions/{args.exam}_test.json"
+
+    if args.verify:
+        mismatches = verify_exam(store, exam, workers=args.workers)
+        for filename in mismatches:
+            print(f"Mismatch: {filename}")
+        print(f"Verification complete. {len(mismatches)} mismatching page(s)")
+        raise SystemExit(1 if mismatches else 0)
+
+    extracted_data, errors, stats = parse_incremental(
+        store,
+        exam,
+        output_file,
+        manifest_path=args.manifest,
+        workers=args.workers,
+        extraction=args.extraction,
+        full=args.full,
+        dedup=args.dedup,
+    )
+    print(
+        f"Parsed {stats['parsed']} new or changed page(s), reused "
+        f"{stats['reused']}, removed {stats['removed']}"
+    )
+    if args.dedup:
+        print(f"Collapsed {stats['duplicates']} near-duplicate question(s)")
+
+    for error in errors:
+        print(f"Skipping file. {error}")
 
-        data = {
-            "filename": filename,
-            "question": question,
-            "choices": choices,
-            "correct_answer": correct_answer,
-            "user_data": user_data,
-        }
+    print(f"Data extraction complete. Output saved to {output_file}")
 
-        extracted_data.append(data)
+    if args.metrics:
+        METRICS.write(args.metrics)
+        print(f"Metrics saved to {args.metrics}")
 
-output_file = f"./questions/{PATH_EXAM}_test.json"
-with open(output_file, "w", encoding="utf-8") as json_file:
-    json.dump(extracted_data, json_file, indent=4, ensure_ascii=True)
 
-print(f"Data extraction complete. Output saved to {output_file}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import json
+import os
+import threading
+
+from cachetools import LRUCache
+
+from config import CORPUS_PATH, DUPLICATES_PATH, QUESTION_CACHE_SIZE, QUESTIONS_DIR
+from corpus import Corpus, build_question
+from dedup import load_exam_clusters
+from metrics import METRICS
+
+
+class QuestionRepository:
+    """
+    Process-wide cache of vendors, exams and parsed questions.
+
+    Entries are keyed on the source's mtime, so a re-parsed exam file or a
+    new vendor directory is picked up on the next access. At most max_exams
+    exams are kept, least recently used first out. Returned question lists
+    are shared between sessions and must not be modified.
+
+    When the compiled corpus (corpus.py) is up to date for an exam, summaries
+    and selected questions are read from it instead of loading the whole
+    JSON file.
+    """
+
+    def __init__(
+        self,
+        root=QUESTIONS_DIR,
+        max_exams=QUESTION_CACHE_SIZE,
+        corpus_path=CORPUS_PATH,
+        duplicates_path=DUPLICATES_PATH,
+    ):
+        self.root = root
+        self.corpus_path = corpus_path
+        self.duplicates_path = duplicates_path
+        self.corpus = Corpus(corpus_path)
+        self.lock = threading.Lock()
+        self.listings = {}
+        self.exam_cache = LRUCache(maxsize=max_exams)
+        self.summaries = LRUCache(maxsize=64)
+        self.duplicates = LRUCache(maxsize=64)
+
+    def _cached_listing(self, path, load):
+        mtime = os.stat(path).st_mtime_ns
+        with self.lock:
+            cached = self.listings.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        listing = load(path)
+        with self.lock:
+            self.listings[path] = (mtime, listing)
+        return listing
+
+    def vendors(self):
+        return self._cached_listing(
+            self.root,
+            lambda path: sorted(
+                d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))
+            ),
+        )
+
+    def exams(self, vendor):
+        """
+        Exam file names (without .json) of one vendor
+        """
+        return self._cached_listing(
+            os.path.join(self.root, vendor),
+            lambda path: sorted(f[:-5] for f in os.listdir(path) if f.endswith(".json")),
+        )
+
+    def exam_path(self, vendor, exam_name):
+        return os.path.join(self.root, vendor, f"{exam_name}.json")
+
+    def questions(self, vendor, exam_name):
+        path = self.exam_path(vendor, exam_name)
+        mtime = os.stat(path).st_mtime_ns
+        key = (vendor, exam_name)
+        with self.lock:
+            cached = self.exam_cache.get(key)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+        with METRICS.timer("load_questions_seconds", source="json"):
+            with open(path, "r") as file:
+                data = json.load(file)
+            questions = tuple(
+                question for question in map(build_question, data) if question is not None
+            )
+
+        with self.lock:
+            self.exam_cache[key] = (mtime, questions)
+        return questions
+
+    def corpus_exam(self, vendor, exam_name):
+        """
+        The exam's corpus entry, or None if the corpus is missing or stale
+        """
+        if not os.path.exists(self.corpus_path):
+            return None
+        try:
+            exam = self.corpus.exam(vendor, exam_name)
+        except Exception:
+            return None
+        stat = os.stat(self.exam_path(vendor, exam_name))
+        if exam and (exam["source_mtime_ns"], exam["source_size"]) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            return exam
+        return None
+
+    def summary(self, vendor, exam_name):
+        """
+        Question count, question numbers, filenames, choice counts and vote
+        consensus by quiz position
+        """
+        exam = self.corpus_exam(vendor, exam_name)
+        if exam is None:
+            questions = self.questions(vendor, exam_name)
+            return {
+                "question_count": len(questions),
+                "question_numbers": tuple(q["question_number"] for q in questions),
+                "filenames": tuple(q["filename"] for q in questions),
+                "choice_counts": tuple(len(q["choices"]) for q in questions),
+                "consensus": tuple(q["consensus"] for q in questions),
+            }
+
+        key = (vendor, exam_name, exam["source_mtime_ns"])
+        with self.lock:
+            summary = self.summaries.get(key)
+        if summary is None:
+            summary = self.corpus.summary(exam["id"])
+            with self.lock:
+                self.summaries[key] = summary
+        return summary
+
+    def warm(self):
+        """
+        Fill the listing and summary caches for every exam, e.g. right after
+        a sync, so first visitors do not pay for it. Returns the exam count.
+        """
+        count = 0
+        for vendor in self.vendors():
+            for exam_name in self.exams(vendor):
+                self.summary(vendor, exam_name)
+                count += 1
+        return count
+
+    def duplicate_positions(self, vendor, exam_name):
+        """
+        Quiz positions whose question is a near-duplicate (dedup.py) of one
+        at an earlier position in the same exam
+        """
+        try:
+            duplicates_mtime = os.stat(self.duplicates_path).st_mtime_ns
+        except FileNotFoundError:
+            return frozenset()
+        exam_mtime = os.stat(self.exam_path(vendor, exam_name)).st_mtime_ns
+        key = (vendor, exam_name, exam_mtime, duplicates_mtime)
+        with self.lock:
+            positions = self.duplicates.get(key)
+        if positions is not None:
+            return positions
+
+        clusters = load_exam_clusters(f"{vendor}/{exam_name}", self.duplicates_path)
+        seen, repeated = set(), set()
+        for position, filename in enumerate(self.summary(vendor, exam_name)["filenames"]):
+            cluster = clusters.get(filename)
+            if cluster in seen:
+                repeated.add(position)
+            elif cluster is not None:
+                seen.add(cluster)
+        positions = frozenset(repeated)
+        with self.lock:
+            self.duplicates[key] = positions
+        return positions
+
+    def search(self, query, limit=20):
+        """
+        Ranked full-text search (Corpus.search) over every exam. Empty when
+        the corpus has not been compiled; hits in exams whose corpus entry
+        is stale are dropped, as their positions may have moved.
+        """
+        if not os.path.exists(self.corpus_path):
+            return []
+        current = {}
+        results = []
+        for result in self.corpus.search(query, limit):
+            key = (result["vendor"], result["exam"])
+            if key not in current:
+                try:
+                    current[key] = self.corpus_exam(*key) is not None
+                except FileNotFoundError:
+                    current[key] = False
+            if current[key]:
+                results.append(result)
+        return results
+
+    def questions_at(self, vendor, exam_name, positions):
+        """
+        Questions at the given quiz positions, in the given order
+        """
+        exam = self.corpus_exam(vendor, exam_name)
+        if exam is None:
+            questions = self.questions(vendor, exam_name)
+            return [questions[position] for position in positions]
+        with METRICS.timer("load_questions_seconds", source="corpus"):
+            return self.corpus.questions_at(exam["id"], positions)
+
+    def question_at(self, vendor, exam_name, position):
+        return self.questions_at(vendor, exam_name, [position])[0]
@@ -0,0 +1,109 @@
+import json
+import logging
+import re
+from urllib.parse import urljoin
+
+from googlesearch import search
+
+from config import SEARCH_HOST, URL_CACHE_PATH
+from utils import write_json_atomic
+
+
+DISCUSSION_LINK_PATTERN = re.compile(
+    r"""href=["'](?P<path>/discussions/[^"'#?]*/view/\d+-(?P<slug>[^"'/#?]+)/?)["']""",
+    re.IGNORECASE,
+)
+INDEX_PAGE_PATTERN = re.compile(r"/discussions/[^\"'/]+/(\d+)/")
+TOPIC_QUESTION_PATTERN = re.compile(r"topic-(\d+)-question-(\d+)")
+
+
+def first_search_result(query):
+    return next(iter(search(query, num_results=1)), None)
+
+
+def harvest_discussion_links(index_html, base_url, exam_slug, topic=None):
+    """
+    Map question number -> discussion URL for one exam from a listing page.
+
+    exam_slug is the part of the discussion slug naming the exam, e.g.
+    "certified-data-engineer-associate". Without a topic filter the lowest
+    topic wins when several topics share a question number.
+    """
+    found = {}
+    for match in DISCUSSION_LINK_PATTERN.finditer(index_html):
+        slug = match.group("slug").lower()
+        numbers = TOPIC_QUESTION_PATTERN.search(slug)
+        if exam_slug.lower() not in slug or not numbers:
+            continue
+        link_topic, number = int(numbers.group(1)), int(numbers.group(2))
+        if topic is not None and link_topic != topic:
+            continue
+        if number not in found or link_topic < found[number][0]:
+            found[number] = (link_topic, urljoin(base_url, match.group("path")))
+    return {number: url for number, (_, url) in found.items()}
+
+
+class UrlResolver:
+    """
+    Resolves search queries to discussion URLs through a persistent
+    query -> URL cache. Misses can be filled in bulk by harvesting an exam's
+    discussion listing; search is only the last resort.
+    """
+
+    def __init__(self, crawler, cache_path=URL_CACHE_PATH):
+        self.crawler = crawler
+        self.cache_path = cache_path
+        self.stats = {"hits": 0, "harvested": 0, "searches": 0}
+        try:
+            with open(cache_path, "r", encoding="utf-8") as file:
+                self.cache = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.cache = {}
+
+    def save(self):
+        write_json_atomic(self.cache_path, self.cache, indent=4, sort_keys=True)
+
+    async def harvest(self, index_url, exam_slug, queries, topic=None):
+        """
+        Fill the cache for {question number: query} from a discussion listing.
+
+        Walks the listing's pages until every query is resolved or the pages
+        run out.
+        """
+        missing = {n: q for n, q in queries.items() if q not in self.cache}
+        if not missing:
+            return
+
+        page, last_page = 1, 1
+        while missing and page <= last_page:
+            page_url = index_url if page == 1 else urljoin(index_url, f"{page}/")
+            response = await self.crawler.fetch(page_url)
+            if page == 1:
+                last_page = max(
+                    [int(n) for n in INDEX_PAGE_PATTERN.findall(response.text)] or [1]
+                )
+
+            links = harvest_discussion_links(response.text, page_url, exam_slug, topic)
+            for number in links.keys() & missing.keys():
+                self.cache[missing.pop(number)] = links[number]
+                self.stats["harvested"] += 1
+            page += 1
+
+        self.save()
+        logging.info(
+            f"Harvested {self.stats['harvested']} discussion URL(s) from "
+            f"{page - 1} listing page(s) of {index_url}"
+        )
+
+    async def resolve(self, query):
+        if query in self.cache:
+            self.stats["hits"] += 1
+            return self.cache[query]
+
+        logging.info(f"Searching for: {query}")
+        self.stats["searches"] += 1
+        url = await self.crawler.call(SEARCH_HOST, first_search_result, query)
+        if url:
+            self.cache[query] = url
+            self.save()
+        return url
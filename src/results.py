@@ -0,0 +1,236 @@
+import atexit
+import itertools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+
+from config import RESULTS_PATH
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    exam TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    positions BLOB,
+    total INTEGER NOT NULL,
+    score INTEGER,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_history ON sessions (user, vendor, exam, started_at);
+CREATE TABLE IF NOT EXISTS answers (
+    session_id TEXT NOT NULL REFERENCES sessions (id),
+    quiz_index INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    exam TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    question_number INTEGER,
+    answer_mask INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    answered_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_session ON answers (session_id, quiz_index);
+CREATE INDEX IF NOT EXISTS answers_question ON answers (user, vendor, exam, filename);
+"""
+
+INSERT_SESSION = (
+    "INSERT INTO sessions (id, user, vendor, exam, mode, positions, total, started_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_ANSWER = (
+    "INSERT INTO answers (session_id, quiz_index, user, vendor, exam, filename, "
+    "question_number, answer_mask, correct, answered_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+FINISH_SESSION = "UPDATE sessions SET score = ?, total = ?, finished_at = ? WHERE id = ?"
+
+# Writes committed per transaction at most.
+BATCH_SIZE = 500
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    return connection
+
+
+class ResultsStore:
+    """
+    Quiz sessions and answers of every user, in SQLite (WAL mode).
+
+    Writes only put a statement on a queue; one background thread per
+    process commits whatever has queued up in a single transaction, so the
+    app never waits on disk. Reads use a connection per thread and, with
+    WAL, do not block on the writer. Reads may lag the latest writes by the
+    time it takes to commit them.
+    """
+
+    def __init__(self, path=RESULTS_PATH):
+        self.path = path
+        connection = connect(path)
+        connection.executescript(SCHEMA)
+        connection.close()
+
+        self.local = threading.local()
+        self.writes = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, name="results-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def _write_loop(self):
+        connection = connect(self.path)
+        stop = False
+        while not stop:
+            batch = [self.writes.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            statements = [write for write in batch if write is not None]
+            try:
+                with connection:
+                    for sql, group in itertools.groupby(statements, key=lambda write: write[0]):
+                        connection.executemany(sql, [params for _, params in group])
+            except sqlite3.Error:
+                logging.exception(f"Dropped {len(statements)} result write(s)")
+            for _ in batch:
+                self.writes.task_done()
+        connection.close()
+
+    def flush(self):
+        """
+        Block until every queued write is committed
+        """
+        self.writes.join()
+
+    def close(self):
+        if self.writer.is_alive():
+            self.writes.put(None)
+            self.writer.join()
+
+    def connection(self):
+        if not hasattr(self.local, "connection"):
+            self.local.connection = connect(self.path)
+        return self.local.connection
+
+    def start_session(self, user, vendor, exam, mode, positions, total):
+        """
+        Record a new quiz and return its id. positions (a sequence of quiz
+        positions, or None for quizzes that grow as they go) is kept so the
+        quiz can be resumed.
+        """
+        session_id = uuid.uuid4().hex
+        blob = None if positions is None else array("I", positions).tobytes()
+        self.writes.put(
+            (INSERT_SESSION, (session_id, user, vendor, exam, mode, blob, total, time.time()))
+        )
+        return session_id
+
+    def record_answer(
+        self, session_id, quiz_index, user, vendor, exam, filename, question_number, mask, correct
+    ):
+        self.writes.put(
+            (
+                INSERT_ANSWER,
+                (
+                    session_id,
+                    quiz_index,
+                    user,
+                    vendor,
+                    exam,
+                    filename,
+                    question_number,
+                    mask,
+                    int(correct),
+                    time.time(),
+                ),
+            )
+        )
+
+    def finish_session(self, session_id, score, total):
+        self.writes.put((FINISH_SESSION, (score, total, time.time(), session_id)))
+
+    def exam_history(self, user, vendor, exam, limit=10):
+        """
+        The user's latest sessions of an exam, newest first
+        """
+        rows = self.connection().execute(
+            "SELECT id, mode, total, score, started_at, finished_at FROM sessions "
+            "WHERE user = ? AND vendor = ? AND exam = ? ORDER BY started_at DESC LIMIT ?",
+            (user, vendor, exam, limit),
+        ).fetchall()
+        keys = ("id", "mode", "total", "score", "started_at", "finished_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def question_stats(self, user, vendor, exam):
+        """
+        {filename: (attempts, mistakes)} over all of the user's answers
+        """
+        return {
+            filename: (attempts, mistakes)
+            for filename, attempts, mistakes in self.connection().execute(
+                "SELECT filename, COUNT(*), COUNT(*) - SUM(correct) FROM answers "
+                "WHERE user = ? AND vendor = ? AND exam = ? GROUP BY filename",
+                (user, vendor, exam),
+            )
+        }
+
+    def weak_questions(self, user, vendor, exam, limit=10):
+        """
+        Questions the user got wrong most often relative to their attempts,
+        as dicts with filename, question_number, attempts and mistakes
+        """
+        rows = self.connection().execute(
+            "SELECT filename, MAX(question_number), COUNT(*) AS attempts, "
+            "COUNT(*) - SUM(correct) AS mistakes FROM answers "
+            "WHERE user = ? AND vendor = ? AND exam = ? GROUP BY filename "
+            "HAVING mistakes > 0 "
+            "ORDER BY CAST(mistakes AS REAL) / attempts DESC, mistakes DESC LIMIT ?",
+            (user, vendor, exam, limit),
+        ).fetchall()
+        keys = ("filename", "question_number", "attempts", "mistakes")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def unfinished_session(self, user, vendor, exam):
+        """
+        The user's latest unfinished, resumable session of an exam with its
+        positions, last answer per question and the filename each answered
+        question had, or None
+        """
+        connection = self.connection()
+        row = connection.execute(
+            "SELECT id, mode, positions FROM sessions WHERE user = ? AND vendor = ? "
+            "AND exam = ? AND finished_at IS NULL AND positions IS NOT NULL "
+            "ORDER BY started_at DESC LIMIT 1",
+            (user, vendor, exam),
+        ).fetchone()
+        if row is None:
+            return None
+        session_id, mode, blob = row
+        positions = array("I")
+        positions.frombytes(blob)
+        answers, filenames = {}, {}
+        for quiz_index, filename, mask, correct in connection.execute(
+            "SELECT quiz_index, filename, answer_mask, correct FROM answers "
+            "WHERE session_id = ? ORDER BY answered_at",
+            (session_id,),
+        ):
+            answers[quiz_index] = (mask, bool(correct))
+            filenames[quiz_index] = filename
+        return {
+            "id": session_id,
+            "mode": mode,
+            "positions": positions,
+            "answers": answers,
+            "filenames": filenames,
+        }
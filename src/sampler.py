@@ -0,0 +1,106 @@
+import random
+from array import array
+
+
+# Practice weights: contested questions start out likelier, a wrong answer
+# makes a question likelier to come back, a right one less likely.
+BASE_WEIGHT = 1.0
+CONTESTED_WEIGHT = 2.0
+MISTAKE_FACTOR = 3.0
+CORRECT_FACTOR = 0.5
+MIN_WEIGHT = 0.05
+MAX_WEIGHT = 50.0
+
+
+class WeightedSampler:
+    """
+    Draws indices with probability proportional to their weight.
+
+    Weights live in a Fenwick (binary indexed) tree, so a draw and a weight
+    update are both O(log n) and nothing is rebuilt between draws. Building
+    the sampler is O(n).
+    """
+
+    def __init__(self, weights):
+        self.weights = array("d", weights)
+        self.size = len(self.weights)
+        self.tree = array("d", [0.0]) + self.weights
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self.top = 1 << (self.size.bit_length() - 1) if self.size else 0
+
+    def __len__(self):
+        return self.size
+
+    def weight(self, index):
+        return self.weights[index]
+
+    def total(self):
+        total, i = 0.0, self.size
+        while i:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def update(self, index, weight):
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def draw(self, rng=random):
+        """
+        Random index, each with probability weight / total
+        """
+        total = self.total()
+        if total <= 0:
+            raise ValueError("Cannot draw from a sampler whose weights are all zero")
+        target = rng.random() * total
+        # Descend the tree: position ends up as the number of leading weights
+        # whose sum does not exceed target.
+        position, step = 0, self.top
+        while step:
+            candidate = position + step
+            if candidate <= self.size and self.tree[candidate] <= target:
+                position = candidate
+                target -= self.tree[candidate]
+            step >>= 1
+        # Rounding can carry target past the last positive weight.
+        while position >= self.size or self.weights[position] <= 0:
+            position -= 1
+        return position
+
+
+def initial_weight(consensus):
+    """
+    Starting weight of a question from its vote consensus (None without votes)
+    """
+    if consensus is None:
+        return BASE_WEIGHT
+    return BASE_WEIGHT + CONTESTED_WEIGHT * (1.0 - consensus)
+
+
+def answered_weight(weight, correct, times=1):
+    factor = (CORRECT_FACTOR if correct else MISTAKE_FACTOR) ** times
+    return min(max(weight * factor, MIN_WEIGHT), MAX_WEIGHT)
+
+
+def practice_weight(consensus, attempts=0, mistakes=0):
+    weight = answered_weight(initial_weight(consensus), False, mistakes)
+    return answered_weight(weight, True, attempts - mistakes)
+
+
+def practice_sampler(consensus, excluded=(), history=None):
+    """
+    Sampler over quiz positions; excluded positions are never drawn.
+    history maps positions to the user's past (attempts, mistakes).
+    """
+    history = history or {}
+    return WeightedSampler(
+        0.0 if position in excluded else practice_weight(value, *history.get(position, ()))
+        for position, value in enumerate(consensus)
+    )
@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+
+from watchdog.events import (
+    EVENT_TYPE_CLOSED,
+    EVENT_TYPE_CREATED,
+    EVENT_TYPE_MODIFIED,
+    EVENT_TYPE_MOVED,
+    FileSystemEventHandler,
+)
+from watchdog.observers import Observer
+
+from config import CORPUS_PATH, PAGE_STORE, QUESTIONS_DIR
+from corpus import build_corpus
+from ingestion import EXAMS, crawl_exams
+from metrics import METRICS
+from page_store import PAGE_STORES, BlobPageStore, content_digest, open_page_store
+from parser import (
+    EXTRACTION_MODES,
+    MANIFEST_NAME,
+    PARSER_VERSION,
+    load_existing_records,
+    load_manifest,
+    parse_page,
+)
+from utils import question_sort_key, write_json_atomic
+
+
+# Pages that land within this many seconds of each other are published together.
+BATCH_DELAY = 0.5
+
+WRITE_EVENTS = {EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED, EVENT_TYPE_CLOSED}
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class ExamPublisher:
+    """
+    One exam's question file, kept current page by page.
+
+    Shares the incremental parser's manifest, so pages published here are
+    not parsed again by parser.py; pages parser.py already parsed, e.g. into
+    its default <exam>_test.json output, are published from their cached
+    records. Unlike parser.py, which writes records in question-number
+    order, new questions are appended and changed ones replaced in place:
+    quiz positions of running sessions stay valid while the exam grows.
+    Pages are never removed here.
+    """
+
+    def __init__(self, store, exam, output_file, extraction="fast"):
+        self.store = store
+        self.exam = exam
+        self.output_file = output_file
+        self.extraction = extraction
+        self.manifest_path = store.manifest_path(exam, MANIFEST_NAME)
+        self._load()
+
+    def _load(self):
+        self.files = load_manifest(self.manifest_path, self.extraction)
+        self.records = load_existing_records(self.output_file)
+        self.output_mtime = _mtime(self.output_file)
+
+    def publish(self, filenames=None):
+        """
+        Parse the given pages (every page of the exam for None) that are new
+        or changed and atomically swap in the updated question file. Nothing
+        is written when no record changed, so readers keep their cache.
+
+        Returns (published, errors).
+        """
+        if _mtime(self.output_file) != self.output_mtime:
+            # Rewritten by someone else, e.g. a parser.py run
+            self._load()
+        if filenames is None:
+            filenames = self.store.list_pages(self.exam)
+        else:
+            filenames = sorted(filenames, key=question_sort_key)
+
+        published, errors = 0, []
+        manifest_changed = False
+        for filename in filenames:
+            cached = self.files.get(filename)
+            try:
+                stat = self.store.stat(self.exam, filename)
+                if not (cached and cached["stat"] == stat):
+                    raw_data = self.store.read(self.exam, filename)
+                    digest = content_digest(raw_data)
+                    if cached and cached["sha256"] == digest:
+                        cached["stat"] = stat
+                        manifest_changed = True
+                    else:
+                        with METRICS.timer("parser_page_seconds"):
+                            record = parse_page(raw_data, filename, self.extraction)
+                        cached = None
+            except Exception as e:
+                # A page that is still being written is retried on its next event
+                METRICS.inc("parser_errors_total")
+                errors.append(f"{filename}: {e}")
+                continue
+            if cached:
+                if filename in self.records:
+                    continue
+                # Parsed before but never published to this file, e.g. by
+                # parser.py into its own output file
+                record = cached["record"]
+            else:
+                self.files[filename] = {"stat": stat, "sha256": digest, "record": record}
+            self.records[filename] = record
+            published += 1
+
+        if published:
+            write_json_atomic(
+                self.output_file, list(self.records.values()), indent=4, ensure_ascii=True
+            )
+            self.output_mtime = _mtime(self.output_file)
+        if published or manifest_changed:
+            write_json_atomic(
+                self.manifest_path,
+                {
+                    "parser_version": PARSER_VERSION,
+                    "extraction": self.extraction,
+                    "files": self.files,
+                },
+            )
+        return published, errors
+
+
+class Pipeline:
+    """
+    Publishes pages as they land. page_saved() may be called from any
+    thread; one background thread publishes whatever has queued up within
+    BATCH_DELAY, one write per exam, then brings the corpus up to date if
+    there is one. Running apps pick the new files up through the
+    repository's mtime checks.
+    """
+
+    def __init__(
+        self,
+        store,
+        questions_dir=QUESTIONS_DIR,
+        corpus_path=CORPUS_PATH,
+        extraction="fast",
+    ):
+        self.store = store
+        self.questions_dir = questions_dir
+        self.corpus_path = corpus_path
+        self.extraction = extraction
+        self.publishers = {}
+        self.pages = queue.Queue()
+        self.thread = threading.Thread(target=self._publish_loop, name="publisher", daemon=True)
+
+    def publisher(self, exam):
+        if exam not in self.publishers:
+            output_file = os.path.join(self.questions_dir, f"{exam}.json")
+            self.publishers[exam] = ExamPublisher(self.store, exam, output_file, self.extraction)
+        return self.publishers[exam]
+
+    def start(self, exams=()):
+        """
+        Publish whatever pages of exams landed while no pipeline was
+        running, then start publishing queued pages
+        """
+        self.publish({exam: None for exam in exams})
+        self.thread.start()
+
+    def page_saved(self, exam, filename=None):
+        """
+        Queue a written page; None stands for every page of the exam
+        """
+        self.pages.put((exam, filename, time.monotonic()))
+
+    def close(self):
+        """
+        Publish the pages still queued and stop
+        """
+        if self.thread.is_alive():
+            self.pages.put(None)
+            self.thread.join()
+
+    def _publish_loop(self):
+        stop = False
+        while not stop:
+            batch = [self.pages.get()]
+            deadline = time.monotonic() + BATCH_DELAY
+            while batch[-1] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pages.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+
+            pending, landed = {}, {}
+            for exam, filename, saved_at in filter(None, batch):
+                filenames = pending.setdefault(exam, set())
+                if filename is None or filenames is None:
+                    pending[exam] = None
+                else:
+                    filenames.add(filename)
+                landed[exam] = min(landed.get(exam, saved_at), saved_at)
+            try:
+                self.publish(pending, landed)
+            except Exception:
+                logging.exception(f"Publishing {', '.join(sorted(pending))} failed")
+
+    def publish(self, pending, landed=None):
+        """
+        Publish {exam: filenames or None} and return the number of pages
+        published. landed maps exams to when their first page was queued.
+        """
+        landed = landed or {}
+        total = 0
+        for exam, filenames in pending.items():
+            publisher = self.publisher(exam)
+            with METRICS.timer("pipeline_publish_seconds"):
+                self.store.reload(exam)
+                published, errors = publisher.publish(filenames)
+            for error in errors:
+                logging.warning(f"Skipping page. {exam}/{error}")
+            if not published:
+                continue
+            total += published
+            METRICS.inc("pipeline_pages_total", published)
+            message = f"Published {published} page(s) of {exam} to {publisher.output_file}"
+            if exam in landed:
+                lag = time.monotonic() - landed[exam]
+                METRICS.observe("pipeline_lag_seconds", lag)
+                message += f", {lag:.1f}s after download"
+            logging.info(message)
+
+        if total and self.corpus_path and os.path.exists(self.corpus_path):
+            with METRICS.timer("pipeline_corpus_seconds"):
+                compiled, _, _ = build_corpus(self.questions_dir, self.corpus_path)
+            logging.info(f"Corpus updated: {compiled} exam(s) recompiled")
+        return total
+
+
+class PageEventHandler(FileSystemEventHandler):
+    """
+    Queues pages another process writes to the page store: loose .html
+    files of the directory store, or index rewrites of the blob store
+    """
+
+    def __init__(self, pipeline, store):
+        self.pipeline = pipeline
+        self.blob_index = (
+            os.path.abspath(os.path.join(store.root, "index"))
+            if isinstance(store, BlobPageStore)
+            else None
+        )
+        self.root = os.path.abspath(store.root)
+
+    def watched_path(self):
+        return self.blob_index or self.root
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in WRITE_EVENTS:
+            return
+        path = os.path.abspath(getattr(event, "dest_path", "") or event.src_path)
+        if self.blob_index:
+            if path.endswith(".json"):
+                exam = os.path.relpath(path, self.blob_index)[:-5]
+                self.pipeline.page_saved(exam.replace(os.sep, "/"))
+        elif path.endswith(".html"):
+            exam = os.path.relpath(os.path.dirname(path), self.root)
+            if exam != ".":
+                self.pipeline.page_saved(exam.replace(os.sep, "/"), os.path.basename(path))
+
+
+def watch(pipeline, store):
+    """
+    Publish pages written by a separate ingestion.py run until interrupted
+    """
+    handler = PageEventHandler(pipeline, store)
+    os.makedirs(handler.watched_path(), exist_ok=True)
+    observer = Observer()
+    observer.schedule(handler, handler.watched_path(), recursive=True)
+    observer.start()
+    # Stop cleanly under service managers too, publishing what is queued
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    logging.info(f"Watching {handler.watched_path()} for new pages")
+    try:
+        while observer.is_alive():
+            observer.join(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Crawl, parse and publish pages as they land, so running apps see new questions within seconds"
+    )
+    arg_parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Publish pages written by a separate ingestion.py run instead of crawling",
+    )
+    arg_parser.add_argument(
+        "--exam",
+        action="append",
+        help="Only this exam (repeatable; default: every exam in ingestion.EXAMS)",
+    )
+    arg_parser.add_argument(
+        "--store",
+        choices=sorted(PAGE_STORES),
+        default=PAGE_STORE,
+        help="Page store to read from (default: config.PAGE_STORE)",
+    )
+    arg_parser.add_argument("--questions-dir", default=QUESTIONS_DIR)
+    arg_parser.add_argument(
+        "--corpus",
+        default=CORPUS_PATH,
+        help="Corpus to keep up to date, if it exists (default: config.CORPUS_PATH)",
+    )
+    arg_parser.add_argument("--extraction", choices=EXTRACTION_MODES, default="fast")
+    arg_parser.add_argument(
+        "--concurrency", type=int, default=8, help="Requests in flight at once"
+    )
+    arg_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Re-fetch already saved pages with conditional GETs",
+    )
+    arg_parser.add_argument(
+        "--metrics",
+        help="Record pipeline metrics and save them to this file (.prom for Prometheus text, else JSON)",
+    )
+    args = arg_parser.parse_args()
+    METRICS.enable(bool(args.metrics))
+
+    exams = [exam for exam in EXAMS if not args.exam or exam["exam"] in args.exam]
+    store = open_page_store(args.store)
+    pipeline = Pipeline(store, args.questions_dir, args.corpus, args.extraction)
+    pipeline.start(args.exam or [exam["exam"] for exam in exams])
+    try:
+        if args.watch:
+            watch(pipeline, store)
+        else:
+            asyncio.run(
+                crawl_exams(
+                    exams,
+                    refresh=args.refresh,
+                    store=store,
+                    on_page=pipeline.page_saved,
+                    concurrency=args.concurrency,
+                )
+            )
+    finally:
+        pipeline.close()
+        if args.metrics:
+            METRICS.write(args.metrics)
+            logging.info(f"Metrics saved to {args.metrics}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,170 @@
 import streamlit as st
-import json
-import os
 import random
+import time
+from array import array
+
+from config import METRICS_ENABLED, METRICS_PORT, SYNC_BUCKET
+from metrics import METRICS
+from repository import QuestionRepository
+from results import ResultsStore
+from sampler import answered_weight, practice_sampler
+from sync import warm_start
+from utils import answer_mask
 
 def format_exam_name(filename):
     name = filename[:-5] if filename.endswith(".json") else filename
     return " ".join(word.capitalize() for word in name.split("_"))
 
+@st.cache_resource
+def get_repository():
+    # One repository per server process, shared by every session. With a
+    # sync bucket it starts from the bucket's latest questions, caches warm.
+    repository = QuestionRepository()
+    if SYNC_BUCKET:
+        warm_start(repository)
+    return repository
+
+@st.cache_resource
+def start_metrics():
+    # One Prometheus endpoint per server process.
+    METRICS.enable()
+    return METRICS.serve(METRICS_PORT)
+
+@st.cache_resource
+def get_results():
+    # One results store, and so one background writer, per server process.
+    return ResultsStore()
+
 def load_vendors():
-    return [d for d in os.listdir("./questions") if os.path.isdir(os.path.join("./questions", d))]
+    return get_repository().vendors()
 
 def load_exams(vendor):
-    exams = []
-    vendor_dir = os.path.join("./questions", vendor)
-    for filename in os.listdir(vendor_dir):
-        if filename.endswith(".json"):
-            exam_name = filename[:-5]
-            formatted_name = format_exam_name(exam_name)
-            exams.append({"file": exam_name, "display": formatted_name})
-    return exams
+    return [
+        {"file": exam_name, "display": format_exam_name(exam_name)}
+        for exam_name in get_repository().exams(vendor)
+    ]
 
 def load_questions(vendor, exam_name):
-    with open(f"./questions/{vendor}/{exam_name}.json", "r") as file:
-        data = json.load(file)
-
-    questions = []
-    for item in data:
-        question_text = item.get("question")
-        choices = item.get("choices", [])
-        user_data = item.get("user_data", [])
-        if user_data:
-            most_voted = max(user_data, key=lambda x: x.get("vote_count", 0))
-            correct_answers = list(most_voted.get("voted_answers", ""))
-        else:
-            correct_answers = []
-
-        if question_text and choices:
-            questions.append({
-                "question": question_text,
-                "choices": choices,
-                "correct_answers": correct_answers,
-            })
+    return get_repository().questions(vendor, exam_name)
+
+def get_question(index):
+    # Sessions only hold positions into the shared exam, never question dicts
+    return get_repository().question_at(st.session_state.selected_vendor,
+                                        st.session_state.selected_exam,
+                                        st.session_state.question_positions[index])
+
+def init_quiz_state(exam_file, positions):
+    """
+    Session state for a quiz: question positions (a range for a full
+    exam), one answer bitmask per question and a correct flag per question
+    """
+    total = len(positions)
+    st.session_state.selected_exam = exam_file
+    st.session_state.question_positions = positions if isinstance(positions, range) else array("I", positions)
+    st.session_state.total_questions = total
+    st.session_state.quiz_started = True
+    st.session_state.user_answers = array("I", [0]) * total
+    st.session_state.correct_answers = bytearray(total)
+    st.session_state.review_status = None
+    st.session_state.reviewing = False
+    st.session_state.sampler = None
+    st.session_state.results_saved = False
+
+def start_quiz(exam_file, positions, mode="quiz"):
+    init_quiz_state(exam_file, positions)
+    # Practice quizzes grow as they go and cannot be resumed
+    st.session_state.session_id = get_results().start_session(
+        st.session_state.user_name, st.session_state.selected_vendor, exam_file, mode,
+        None if mode == "practice" else positions, len(positions))
+
+def resume_quiz(exam_file, session):
+    init_quiz_state(exam_file, session["positions"])
+    for index, (mask, correct) in session["answers"].items():
+        st.session_state.user_answers[index] = mask
+        st.session_state.correct_answers[index] = correct
+    st.session_state.session_id = session["id"]
+    st.session_state.current_question = min(max(session["answers"], default=-1) + 1,
+                                            st.session_state.total_questions - 1)
+
+def resumable(session, summary):
+    """
+    Whether a stored quiz still fits the exam. Positions index the exam
+    file's current order, which re-parsing, dedup and new pages can change,
+    so every answered position must still hold the question answered there.
+    """
+    positions, filenames = session["positions"], summary["filenames"]
+    if max(positions, default=0) >= summary["question_count"]:
+        return False
+    return all(filenames[positions[index]] == filename
+               for index, filename in session["filenames"].items())
+
+def start_practice(exam_file, consensus, excluded, history):
+    """
+    Adaptive practice: questions are drawn one at a time from a weighted
+    sampler kept in session state, so reruns never rebuild its weights
+    """
+    sampler = practice_sampler(consensus, excluded, history)
+    start_quiz(exam_file, [sampler.draw()], mode="practice")
+    st.session_state.sampler = sampler
+
+def draw_practice_question():
+    st.session_state.question_positions.append(st.session_state.sampler.draw())
+    st.session_state.user_answers.append(0)
+    st.session_state.correct_answers.append(0)
+    st.session_state.total_questions += 1
+
+def open_question(vendor, exam_file, position):
+    # A search hit opens the whole exam at that question
+    st.session_state.selected_vendor = vendor
+    st.session_state.exams = load_exams(vendor)
+    start_quiz(exam_file, range(get_repository().summary(vendor, exam_file)["question_count"]))
+    st.session_state.current_question = position
+
+def render_search():
+    query = st.text_input("Search all questions", key="search_query")
+    if not query.strip():
+        return
+    results = get_repository().search(query)
+    if not results:
+        st.write("No matching questions. Compile the corpus (src/corpus.py) to enable search.")
+        return
+    for i, result in enumerate(results):
+        label = (f"{result['vendor']} - {format_exam_name(result['exam'])}, "
+                 f"question {result['question_number'] or result['quiz_position'] + 1}")
+        if st.button(label, key=f"search_result_{i}"):
+            open_question(result["vendor"], result["exam"], result["quiz_position"])
+            st.rerun()
+        st.caption(result["snippet"].replace("\n", " "))
+
+def render_history(vendor, exam_file, summary):
+    """
+    Resume button for the user's last unfinished quiz of the exam, and
+    their past scores and weakest questions
+    """
+    results = get_results()
+    user = st.session_state.user_name
+    session = results.unfinished_session(user, vendor, exam_file)
+    if session and resumable(session, summary):
+        if st.button(f"Resume last quiz ({len(session['answers'])} of "
+                     f"{len(session['positions'])} answered)"):
+            resume_quiz(exam_file, session)
+            st.rerun()
 
-    return questions
+    history = results.exam_history(user, vendor, exam_file)
+    if not history:
+        return
+    with st.expander("Your history"):
+        for past in history:
+            started = time.strftime("%Y-%m-%d %H:%M", time.localtime(past["started_at"]))
+            outcome = (f"{past['score']} / {past['total']}" if past["finished_at"] is not None
+                       else "unfinished")
+            st.write(f"{started} - {past['mode']}: {outcome}")
+        weak = results.weak_questions(user, vendor, exam_file)
+        if weak:
+            st.write("Questions you miss most:")
+            for question in weak:
+                st.write(f"- Question {question['question_number']}: wrong "
+                         f"{question['mistakes']} of {question['attempts']} time(s)")
 
 def initialize_session_state():
     if "vendors" not in st.session_state:
@@ -53,22 +175,30 @@ def initialize_session_state():
         st.session_state.exams = []
     if "selected_exam" not in st.session_state:
         st.session_state.selected_exam = None
-    if "questions" not in st.session_state:
-        st.session_state.questions = []
+    if "question_positions" not in st.session_state:
+        st.session_state.question_positions = range(0)
     if "current_question" not in st.session_state:
         st.session_state.current_question = 0
     if "total_questions" not in st.session_state:
         st.session_state.total_questions = 0
     if "user_answers" not in st.session_state:
-        st.session_state.user_answers = {}
+        st.session_state.user_answers = array("I")
     if "correct_answers" not in st.session_state:
-        st.session_state.correct_answers = set()
+        st.session_state.correct_answers = bytearray()
     if "quiz_started" not in st.session_state:
         st.session_state.quiz_started = False
     if "quiz_completed" not in st.session_state:
         st.session_state.quiz_completed = False
+    if "review_status" not in st.session_state:
+        st.session_state.review_status = None
+    if "reviewing" not in st.session_state:
+        st.session_state.reviewing = False
     if "quiz_mode" not in st.session_state:
         st.session_state.quiz_mode = "full"
+    if "sampler" not in st.session_state:
+        st.session_state.sampler = None
+    if "user_name" not in st.session_state:
+        st.session_state.user_name = "guest"
 
 def select_questions(all_questions, mode, num_questions=None, start_idx=None, end_idx=None):
     if mode == "full":
@@ -89,7 +219,79 @@ def select_questions(all_questions, mode, num_questions=None, start_idx=None, en
     return all_questions
 
 def calculate_score():
-    return len(st.session_state.correct_answers)
+    return sum(st.session_state.correct_answers)
+
+REVIEW_UNANSWERED, REVIEW_CORRECT, REVIEW_INCORRECT = 0, 1, 2
+REVIEW_FILTERS = {
+    "All": (REVIEW_UNANSWERED, REVIEW_CORRECT, REVIEW_INCORRECT),
+    "Incorrect only": (REVIEW_INCORRECT,),
+    "Unanswered only": (REVIEW_UNANSWERED,),
+}
+
+def review_status():
+    """
+    Per-question review status, computed once when the quiz is completed
+    """
+    if st.session_state.review_status is None:
+        st.session_state.review_status = bytes(
+            REVIEW_CORRECT if correct else REVIEW_INCORRECT if answer else REVIEW_UNANSWERED
+            for correct, answer in zip(st.session_state.correct_answers,
+                                       st.session_state.user_answers))
+    return st.session_state.review_status
+
+def choice_texts(question, mask):
+    choices = question["choices"]
+    return [choices[i] for i in range(min(mask.bit_length(), len(choices))) if mask >> i & 1]
+
+def render_review():
+    """
+    One page of the review; only the questions on the page are loaded
+    """
+    status = review_status()
+    total = st.session_state.total_questions
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        review_filter = st.selectbox("Show", list(REVIEW_FILTERS), key="review_filter")
+    with col2:
+        page_size = st.selectbox("Questions per page", [10, 25, 50], key="review_page_size")
+    with col3:
+        first, last = st.slider("Question range", 1, max(total, 2), (1, total), key="review_range")
+
+    shown = REVIEW_FILTERS[review_filter]
+    indices = [i for i in range(first - 1, min(last, total)) if status[i] in shown]
+    if not indices:
+        st.write("No questions match this filter.")
+        return
+
+    page_count = (len(indices) + page_size - 1) // page_size
+    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count,
+                           value=1, key="review_page")
+    page_indices = indices[(page - 1) * page_size:page * page_size]
+    questions = get_repository().questions_at(
+        st.session_state.selected_vendor, st.session_state.selected_exam,
+        [st.session_state.question_positions[i] for i in page_indices])
+
+    for i, question in zip(page_indices, questions):
+        st.write(f"\nQuestion {i + 1}: {question['question']}")
+
+        user_answer_texts = choice_texts(question, st.session_state.user_answers[i])
+        st.write("Your answer(s):")
+        if user_answer_texts:
+            for ans in user_answer_texts:
+                st.write(f"- {ans}")
+        else:
+            st.write("- No answer provided")
+
+        st.write("Correct answer(s):")
+        for ans in choice_texts(question, answer_mask(question["correct_answers"])):
+            st.write(f"- {ans}")
+
+        if status[i] == REVIEW_CORRECT:
+            st.success("✓ Correct")
+        else:
+            st.error("✗ Incorrect")
+        st.markdown("---")
 
 def run_quiz():
     st.title("Exam Quiz App")
@@ -97,69 +299,113 @@ def run_quiz():
     initialize_session_state()
 
     if not st.session_state.quiz_started:
+        render_search()
+
+        # Widget state is dropped while the quiz is shown; user_name is not
+        if "user_name_input" not in st.session_state:
+            st.session_state.user_name_input = st.session_state.user_name
+        user_name = st.text_input("Your name", key="user_name_input")
+        st.session_state.user_name = user_name.strip() or "guest"
+
         st.write("Select a vendor and exam to start the quiz:")
 
-        selected_vendor = st.selectbox("Choose a vendor", st.session_state.vendors)
+        # Listings are cached on their directory's mtime, so refreshing them
+        # every rerun is cheap and shows exams published since the session began.
+        # A changed listing makes a new widget; index keeps the choice.
+        st.session_state.vendors = load_vendors()
+        vendors = st.session_state.vendors
+        selected_vendor = st.selectbox("Choose a vendor", vendors,
+                                       index=vendors.index(st.session_state.selected_vendor)
+                                       if st.session_state.selected_vendor in vendors else 0)
 
         if selected_vendor != st.session_state.selected_vendor:
             st.session_state.selected_vendor = selected_vendor
-            st.session_state.exams = load_exams(selected_vendor)
             st.session_state.selected_exam = None
+        if st.session_state.selected_vendor:
+            st.session_state.exams = load_exams(st.session_state.selected_vendor)
 
         if st.session_state.selected_vendor:
             exam_options = {exam["display"]: exam["file"] for exam in st.session_state.exams}
-            selected_exam_display = st.selectbox("Choose an exam", list(exam_options.keys()))
+            exam_files = list(exam_options.values())
+            selected_exam_display = st.selectbox("Choose an exam", list(exam_options.keys()),
+                                                 index=exam_files.index(st.session_state.selected_exam)
+                                                 if st.session_state.selected_exam in exam_files else 0)
             selected_exam_file = exam_options[selected_exam_display]
+            st.session_state.selected_exam = selected_exam_file
 
             # Quiz mode selection
             quiz_mode = st.radio("Select Quiz Mode", 
-                               ["Full Exam", "Custom Number of Questions", "Question Range"],
+                               ["Full Exam", "Custom Number of Questions", "Question Range",
+                                "Practice (adaptive)"],
                                key="quiz_mode_select")
             
-            all_questions = load_questions(st.session_state.selected_vendor, selected_exam_file)
-            total_available = len(all_questions)
+            # Counts and question numbers only; bodies are loaded on start
+            summary = get_repository().summary(st.session_state.selected_vendor, selected_exam_file)
+            # Near-duplicates of an earlier question are never served twice
+            duplicates = get_repository().duplicate_positions(st.session_state.selected_vendor,
+                                                              selected_exam_file)
+            positions = range(summary["question_count"])
+            if duplicates:
+                positions = [position for position in positions if position not in duplicates]
+            total_available = len(positions)
             
             st.write(f"Total available questions: {total_available}")
+            render_history(st.session_state.selected_vendor, selected_exam_file, summary)
+            if duplicates:
+                st.caption(f"{len(duplicates)} near-duplicate question(s) hidden")
             
             # Mode-specific options
-            selected_questions = all_questions
+            num_questions = None
             if quiz_mode == "Custom Number of Questions":
                 num_questions = st.number_input("Number of questions", 
                                              min_value=1, 
                                              max_value=total_available,
                                              value=min(10, total_available))
-                selected_questions = select_questions(all_questions, "custom", num_questions=num_questions)
                 
             elif quiz_mode == "Question Range":
+                # Ranges use the real ExamTopics question numbers
+                numbers = [number if number is not None else position + 1
+                           for position, number in enumerate(summary["question_numbers"])]
+                lowest, highest = min(numbers), max(numbers)
                 col1, col2 = st.columns(2)
                 with col1:
-                    start_idx = st.number_input("Start from question", 
-                                              min_value=1, 
-                                              max_value=total_available,
-                                              value=1) - 1
+                    start_number = st.number_input("Start from question", 
+                                                 min_value=lowest, 
+                                                 max_value=highest,
+                                                 value=lowest)
                 with col2:
-                    end_idx = st.number_input("End at question", 
-                                            min_value=1, 
-                                            max_value=total_available,
-                                            value=min(start_idx + 10, total_available))
+                    end_number = st.number_input("End at question", 
+                                               min_value=lowest, 
+                                               max_value=highest,
+                                               value=min(start_number + 9, highest))
                 
-                num_questions = st.number_input("Number of questions from range", 
-                                             min_value=1, 
-                                             max_value=end_idx - start_idx,
-                                             value=min(10, end_idx - start_idx))
-                
-                selected_questions = select_questions(all_questions, "range", 
-                                                   num_questions=num_questions,
-                                                   start_idx=start_idx,
-                                                   end_idx=end_idx)
-
-            if st.button("Start Quiz"):
-                st.session_state.selected_exam = selected_exam_file
-                st.session_state.questions = selected_questions
-                st.session_state.total_questions = len(selected_questions)
-                st.session_state.quiz_started = True
-                st.session_state.user_answers = {}
-                st.session_state.correct_answers = set()
+                positions = sorted((position for position in positions
+                                    if start_number <= numbers[position] <= end_number),
+                                   key=lambda position: numbers[position])
+                if positions:
+                    num_questions = st.number_input("Number of questions from range", 
+                                                 min_value=1, 
+                                                 max_value=len(positions),
+                                                 value=min(10, len(positions)))
+                else:
+                    st.warning("No questions in this range.")
+
+            elif quiz_mode == "Practice (adaptive)":
+                st.caption("Questions are drawn one at a time, favouring ones you got wrong "
+                           "and ones the community disagrees on.")
+
+            if st.button("Start Quiz", disabled=not positions):
+                if quiz_mode == "Practice (adaptive)":
+                    stats = get_results().question_stats(st.session_state.user_name,
+                                                         st.session_state.selected_vendor,
+                                                         selected_exam_file)
+                    history = {position: stats[filename]
+                               for position, filename in enumerate(summary["filenames"])
+                               if filename in stats}
+                    start_practice(selected_exam_file, summary["consensus"], duplicates, history)
+                else:
+                    start_quiz(selected_exam_file,
+                               select_questions(positions, "custom", num_questions=num_questions))
                 st.rerun()
 
     # Rest of your existing quiz logic remains the same
@@ -168,31 +414,41 @@ def run_quiz():
         st.title(quiz_title)
 
         st.sidebar.header("Progress")
-        progress = len(st.session_state.correct_answers) / st.session_state.total_questions
+        score = calculate_score()
+        progress = score / st.session_state.total_questions
         st.sidebar.progress(progress)
-        st.sidebar.write(f"Correct Answers: {len(st.session_state.correct_answers)} / {st.session_state.total_questions}")
+        st.sidebar.write(f"Correct Answers: {score} / {st.session_state.total_questions}")
 
-        question = st.session_state.questions[st.session_state.current_question]
+        question = get_question(st.session_state.current_question)
         st.markdown(f"<h2>Question {st.session_state.current_question + 1} of {st.session_state.total_questions}</h2>", unsafe_allow_html=True)
         st.write(question["question"])
 
-        user_answer = st.session_state.user_answers.get(st.session_state.current_question, [])
+        user_answer = st.session_state.user_answers[st.session_state.current_question]
         for i, choice in enumerate(question["choices"]):
             if st.checkbox(choice, 
                          key=f"q{st.session_state.current_question}_choice{i}",
-                         value=chr(65 + i) in user_answer):
-                if chr(65 + i) not in user_answer:
-                    user_answer.append(chr(65 + i))
-            elif chr(65 + i) in user_answer:
-                user_answer.remove(chr(65 + i))
+                         value=bool(user_answer >> i & 1)):
+                user_answer |= 1 << i
+            else:
+                user_answer &= ~(1 << i)
         st.session_state.user_answers[st.session_state.current_question] = user_answer
 
         if st.button("Submit Answer"):
-            if set(user_answer) == set(question["correct_answers"]):
+            correct = user_answer == answer_mask(question["correct_answers"])
+            if correct:
                 st.success("Correct!")
-                st.session_state.correct_answers.add(st.session_state.current_question)
+                st.session_state.correct_answers[st.session_state.current_question] = 1
             else:
                 st.error(f"Incorrect. The correct answer(s) are: {', '.join(question['correct_answers'])}")
+            # Queued for the background writer, never waits on disk
+            get_results().record_answer(st.session_state.session_id, st.session_state.current_question,
+                                        st.session_state.user_name, st.session_state.selected_vendor,
+                                        st.session_state.selected_exam, question["filename"] or "",
+                                        question["question_number"], user_answer, correct)
+            sampler = st.session_state.sampler
+            if sampler is not None:
+                position = st.session_state.question_positions[st.session_state.current_question]
+                sampler.update(position, answered_weight(sampler.weight(position), correct))
 
         # Navigation buttons
         col1, col2, col3, col4 = st.columns(4)
@@ -205,9 +461,14 @@ def run_quiz():
                 st.session_state.current_question -= 1
                 st.rerun()
         with col3:
-            if st.button("Next ▶️") and st.session_state.current_question < st.session_state.total_questions - 1:
-                st.session_state.current_question += 1
-                st.rerun()
+            if st.button("Next ▶️"):
+                if st.session_state.current_question < st.session_state.total_questions - 1:
+                    st.session_state.current_question += 1
+                    st.rerun()
+                elif st.session_state.sampler is not None:
+                    draw_practice_question()
+                    st.session_state.current_question += 1
+                    st.rerun()
         with col4:
             if st.button("Last ⏩"):
                 st.session_state.current_question = st.session_state.total_questions - 1
@@ -236,37 +497,24 @@ def run_quiz():
         final_percentage = (final_score / st.session_state.total_questions) * 100
         st.write(f"Your final score: {final_score} out of {st.session_state.total_questions}")
         st.write(f"Final Percentage: {final_percentage:.2f}%")
+        if not st.session_state.results_saved:
+            get_results().finish_session(st.session_state.session_id, final_score,
+                                         st.session_state.total_questions)
+            st.session_state.results_saved = True
 
         if st.button("Review Answers"):
-            for i, question in enumerate(st.session_state.questions):
-                st.write(f"\nQuestion {i + 1}: {question['question']}")
-                
-                user_answer_letters = st.session_state.user_answers.get(i, [])
-                user_answer_texts = [question['choices'][ord(letter) - ord('A')] 
-                                   for letter in user_answer_letters]
-                st.write("Your answer(s):")
-                if user_answer_texts:
-                    for ans in user_answer_texts:
-                        st.write(f"- {ans}")
-                else:
-                    st.write("- No answer provided")
-
-                correct_answer_texts = [question['choices'][ord(letter) - ord('A')] 
-                                      for letter in question['correct_answers']]
-                st.write("Correct answer(s):")
-                for ans in correct_answer_texts:
-                    st.write(f"- {ans}")
-
-                if i in st.session_state.correct_answers:
-                    st.success("✓ Correct")
-                else:
-                    st.error("✗ Incorrect")
-                st.markdown("---")
+            st.session_state.reviewing = True
+        if st.session_state.reviewing:
+            render_review()
 
         if st.button("Start New Quiz"):
             for key in list(st.session_state.keys()):
-                del st.session_state[key]
+                if key != "user_name":
+                    del st.session_state[key]
             st.rerun()
 
 if __name__ == "__main__":
-    run_quiz()
\ No newline at end of file
+    if METRICS_ENABLED:
+        start_metrics()
+    with METRICS.timer("app_rerun_seconds"):
+        run_quiz()
\ No newline at end of file
@@ -0,0 +1,536 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    HTML_PAGES_DIR,
+    PAGE_STORE,
+    PAGE_STORE_DIR,
+    QUESTIONS_DIR,
+    SYNC_BUCKET,
+    SYNC_ENDPOINT_URL,
+    SYNC_PREFIX,
+    SYNC_STATE_PATH,
+    SYNC_WORKERS,
+)
+from corpus import build_corpus
+from metrics import METRICS
+from page_store import content_digest
+from utils import write_json_atomic
+
+
+# Bump whenever the bucket layout or manifest format changes.
+MANIFEST_VERSION = 1
+
+# Files from this size up are transferred in parts of this size, several
+# parts at a time.
+MULTIPART_SIZE = 8 * 1024 * 1024
+PART_CONCURRENCY = 4
+# Whole-file attempts on top of botocore's per-request retries.
+TRANSFER_ATTEMPTS = 3
+# Most keys one DeleteObjects request takes.
+DELETE_BATCH = 1000
+
+DEFAULT_PATHS = (HTML_PAGES_DIR if PAGE_STORE == "directory" else PAGE_STORE_DIR, QUESTIONS_DIR)
+
+
+def s3_client(endpoint_url=SYNC_ENDPOINT_URL, workers=SYNC_WORKERS):
+    """
+    S3 client with enough pooled connections for workers transfers of
+    PART_CONCURRENCY parts each. Clients are thread-safe, so one is shared.
+    """
+    # Imported here: boto3 is slow to import and the app only needs it with a bucket
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=workers * PART_CONCURRENCY,
+        retries={"max_attempts": 5, "mode": "standard"},
+    )
+    return boto3.client("s3", endpoint_url=endpoint_url, config=config)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _local_path(path):
+    return path.replace("/", os.sep)
+
+
+def _in_paths(path, paths):
+    return any(root == "." or path == root or path.startswith(root + "/") for root in paths)
+
+
+def _normalize_paths(paths):
+    normalized = []
+    for path in paths:
+        relative = os.path.relpath(path)
+        if relative == ".." or relative.startswith(".." + os.sep):
+            raise ValueError(f"Can only sync paths below the working directory: {path}")
+        normalized.append(relative.replace(os.sep, "/"))
+    return normalized
+
+
+class BundleSync:
+    """
+    Delta sync of local files (the page store, questions/) with a bucket.
+
+    The bucket keeps every file under <prefix>/files/ plus a manifest of
+    their hashes, split into one gzipped shard per directory. Shards are
+    named by the hash of their content and never change; <prefix>/index.json
+    maps each directory to its current shard and is the only object that is
+    rewritten. A sync fetches the index with a conditional GET, only the
+    shards that changed since the last sync (the others are cached in the
+    state file) and only the files whose hash differs, so a sync after a
+    small refresh moves kilobytes. Local hashes are cached by size and
+    mtime, so unchanged files are not even read.
+
+    One writer per prefix at a time: concurrent pushes can drop each other's
+    manifest changes. Superseded shards stay in the bucket for readers that
+    are mid-sync.
+    """
+
+    def __init__(
+        self,
+        bucket=SYNC_BUCKET,
+        prefix=SYNC_PREFIX,
+        endpoint_url=SYNC_ENDPOINT_URL,
+        workers=SYNC_WORKERS,
+        state_path=SYNC_STATE_PATH,
+        client=None,
+    ):
+        if not bucket:
+            raise ValueError("No bucket to sync with; set config.SYNC_BUCKET or pass --bucket")
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.workers = workers
+        self.state_path = state_path
+        self.client = client or s3_client(endpoint_url, workers)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_SIZE,
+            multipart_chunksize=MULTIPART_SIZE,
+            max_concurrency=PART_CONCURRENCY,
+        )
+        self.location = f"{endpoint_url or 's3'}/{bucket}/{self.prefix}"
+        self.lock = threading.Lock()
+        self.stats = {}
+
+        try:
+            with open(state_path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        if state.get("version") != MANIFEST_VERSION:
+            state = {"version": MANIFEST_VERSION}
+        self.state = state
+        self.local_cache = state.setdefault("files", {})
+        self.remote_cache = state.setdefault("remotes", {}).get(self.location) or {
+            "etag": None,
+            "index": {"version": MANIFEST_VERSION, "shards": {}},
+            "shards": {},
+        }
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def save_state(self):
+        self.state["remotes"][self.location] = self.remote_cache
+        write_json_atomic(self.state_path, self.state)
+
+    def scan_local(self, paths):
+        """
+        {path: (sha256, size)} of every file under paths, relative to the
+        working directory with / separators. Temp files are skipped.
+        """
+        paths = _normalize_paths(paths)
+        found = {}
+        for root in paths:
+            if os.path.isfile(_local_path(root)):
+                found[root] = os.stat(_local_path(root))
+                continue
+            for directory, _, filenames in os.walk(_local_path(root)):
+                for filename in filenames:
+                    if filename.endswith(".tmp"):
+                        continue
+                    local_path = os.path.join(directory, filename)
+                    found[os.path.relpath(local_path).replace(os.sep, "/")] = os.stat(local_path)
+
+        to_hash = []
+        for path, stat in found.items():
+            cached = self.local_cache.get(path)
+            if not cached or (cached["size"], cached["mtime_ns"]) != (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                to_hash.append(path)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            digests = executor.map(file_digest, map(_local_path, to_hash))
+            for path, digest in zip(to_hash, digests):
+                stat = found[path]
+                self.local_cache[path] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "sha256": digest,
+                }
+        for path in list(self.local_cache):
+            if path not in found and _in_paths(path, paths):
+                del self.local_cache[path]
+        return {
+            path: (self.local_cache[path]["sha256"], stat.st_size) for path, stat in found.items()
+        }
+
+    def fetch_remote(self):
+        """
+        {path: [sha256, size]} of every file in the bucket's manifest; empty
+        if the prefix has no manifest, see has_manifest()
+        """
+        from botocore.exceptions import ClientError
+
+        cache = self.remote_cache
+        request = {"Bucket": self.bucket, "Key": self._key("index.json")}
+        if cache["etag"]:
+            request["IfNoneMatch"] = cache["etag"]
+        try:
+            response = self.client.get_object(**request)
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code in ("NoSuchKey", "404"):
+                cache.update(etag=None, index={"version": MANIFEST_VERSION, "shards": {}})
+            elif code not in ("NotModified", "304"):
+                raise
+        else:
+            body = response["Body"].read()
+            self._count("metadata_bytes", len(body))
+            index = json.loads(body)
+            if index.get("version") != MANIFEST_VERSION:
+                raise ValueError(
+                    f"Bucket manifest has version {index.get('version')}, "
+                    f"expected {MANIFEST_VERSION}"
+                )
+            cache.update(etag=response["ETag"], index=index)
+
+        current = set(cache["index"]["shards"].values())
+        missing = sorted(current - set(cache["shards"]))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for digest, files in zip(missing, executor.map(self._get_shard, missing)):
+                cache["shards"][digest] = files
+        cache["shards"] = {digest: cache["shards"][digest] for digest in current}
+        return {path: entry for files in cache["shards"].values() for path, entry in files.items()}
+
+    def has_manifest(self):
+        """
+        Whether the last fetch_remote() found a manifest under the prefix
+        """
+        return self.remote_cache["etag"] is not None
+
+    def _get_shard(self, digest):
+        body = self.client.get_object(
+            Bucket=self.bucket, Key=self._key(f"shards/{digest}.json.gz")
+        )["Body"].read()
+        self._count("metadata_bytes", len(body))
+        return json.loads(gzip.decompress(body))
+
+    def _put_shard(self, shard):
+        digest, body = shard
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(f"shards/{digest}.json.gz"),
+            Body=body,
+            ContentType="application/json",
+            ContentEncoding="gzip",
+        )
+        self._count("metadata_bytes", len(body))
+
+    def publish_manifest(self, manifest):
+        """
+        Upload the shards of manifest that changed, then swap in the index
+        """
+        by_directory = {}
+        for path, entry in manifest.items():
+            by_directory.setdefault(posixpath.dirname(path), {})[path] = entry
+
+        shards, new_shards = {}, []
+        for directory, files in sorted(by_directory.items()):
+            body = json.dumps(files, sort_keys=True, separators=(",", ":")).encode()
+            digest = content_digest(body)
+            shards[directory] = digest
+            if digest not in self.remote_cache["shards"]:
+                self.remote_cache["shards"][digest] = files
+                new_shards.append((digest, gzip.compress(body, mtime=0)))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(self._put_shard, new_shards))
+
+        index = {"version": MANIFEST_VERSION, "shards": shards}
+        body = json.dumps(index, indent=1).encode()
+        response = self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._key("index.json"),
+            Body=body,
+            ContentType="application/json",
+        )
+        self._count("metadata_bytes", len(body))
+        self.remote_cache.update(etag=response["ETag"], index=index)
+        current = set(shards.values())
+        self.remote_cache["shards"] = {
+            digest: files
+            for digest, files in self.remote_cache["shards"].items()
+            if digest in current
+        }
+
+    def _transfer(self, transfer, paths, direction):
+        """
+        Run transfer(path) for every path across the pool, retrying each
+        file with jittered backoff. Returns the paths that made it.
+        """
+
+        def attempt(path):
+            for attempt in range(TRANSFER_ATTEMPTS):
+                try:
+                    with METRICS.timer("sync_transfer_seconds", direction=direction):
+                        size = transfer(path)
+                except Exception as e:
+                    if attempt + 1 == TRANSFER_ATTEMPTS:
+                        logging.error(f"Giving up on {direction} of {path}: {e}")
+                        return False
+                    time.sleep(2**attempt * random.uniform(0.8, 1.2))
+                    continue
+                METRICS.inc("sync_bytes_total", size, direction=direction)
+                self._count("bytes", size)
+                return True
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            done = [path for path, ok in zip(paths, executor.map(attempt, paths)) if ok]
+        self._count("failed", len(paths) - len(done))
+        return done
+
+    def _upload(self, local):
+        def upload(path):
+            digest, size = local[path]
+            self.client.upload_file(
+                _local_path(path),
+                self.bucket,
+                self._key(f"files/{path}"),
+                ExtraArgs={"Metadata": {"sha256": digest}},
+                Config=self.transfer_config,
+            )
+            return size
+
+        return upload
+
+    def _download(self, remote):
+        def download(path):
+            digest, size = remote[path]
+            target = _local_path(path)
+            directory = os.path.dirname(target) or "."
+            os.makedirs(directory, exist_ok=True)
+            # Swapped in whole, so the app never reads a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            os.close(fd)
+            try:
+                self.client.download_file(
+                    self.bucket, self._key(f"files/{path}"), tmp_path, Config=self.transfer_config
+                )
+                if file_digest(tmp_path) != digest:
+                    raise ValueError("content does not match the manifest hash")
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, target)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            return size
+
+        return download
+
+    def _delete_remote(self, paths):
+        for start in range(0, len(paths), DELETE_BATCH):
+            batch = paths[start : start + DELETE_BATCH]
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={
+                    "Objects": [{"Key": self._key(f"files/{path}")} for path in batch],
+                    "Quiet": True,
+                },
+            )
+
+    def push(self, paths=DEFAULT_PATHS, delete=False, dry_run=False):
+        """
+        Upload new and changed files under paths; with delete=True also
+        remove files from the bucket that no longer exist under paths.
+        Returns stats (counts and bytes moved).
+        """
+        self.stats = {}
+        local = self.scan_local(paths)
+        remote = self.fetch_remote()
+        scope = _normalize_paths(paths)
+        uploads = sorted(
+            path for path, entry in local.items() if remote.get(path, [None])[0] != entry[0]
+        )
+        deletes = []
+        if delete:
+            deletes = sorted(
+                path for path in remote if path not in local and _in_paths(path, scope)
+            )
+        self._count("unchanged", len(local) - len(uploads))
+        if dry_run:
+            self.stats.update(uploaded=len(uploads), deleted=len(deletes))
+            return self.stats
+
+        manifest = dict(remote)
+        uploaded = self._transfer(self._upload(local), uploads, "upload")
+        for path in uploaded:
+            manifest[path] = list(local[path])
+        self._delete_remote(deletes)
+        for path in deletes:
+            del manifest[path]
+        if uploaded or deletes:
+            self.publish_manifest(manifest)
+        self.save_state()
+        self.stats.update(uploaded=len(uploaded), deleted=len(deletes))
+        return self.stats
+
+    def pull(self, paths=DEFAULT_PATHS, delete=False, dry_run=False):
+        """
+        Download files under paths that are new or changed in the bucket;
+        with delete=True also remove local files the bucket no longer has.
+        Returns stats (counts and bytes moved).
+        """
+        self.stats = {}
+        scope = _normalize_paths(paths)
+        remote = {
+            path: entry
+            for path, entry in self.fetch_remote().items()
+            if _in_paths(path, scope)
+        }
+        if delete and not self.has_manifest():
+            # A mistyped bucket or prefix would look empty and wipe the local files
+            raise ValueError(
+                f"No manifest at {self.location}; refusing to delete local files"
+            )
+        local = self.scan_local(paths)
+        downloads = sorted(
+            path for path, entry in remote.items() if local.get(path, [None])[0] != entry[0]
+        )
+        deletes = sorted(set(local) - set(remote)) if delete else []
+        self._count("unchanged", len(remote) - len(downloads))
+        if dry_run:
+            self.stats.update(downloaded=len(downloads), deleted=len(deletes))
+            return self.stats
+
+        downloaded = self._transfer(self._download(remote), downloads, "download")
+        for path in downloaded:
+            stat = os.stat(_local_path(path))
+            self.local_cache[path] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": remote[path][0],
+            }
+        for path in deletes:
+            os.unlink(_local_path(path))
+            self.local_cache.pop(path, None)
+        self.save_state()
+        self.stats.update(downloaded=len(downloaded), deleted=len(deletes))
+        return self.stats
+
+
+def warm_start(repository, bucket=SYNC_BUCKET, **options):
+    """
+    Pull the latest questions from the bucket, bring the corpus up to date
+    and fill the repository's listing and summary caches, so the first
+    visitors of a fresh server do not wait on any of it. A failed pull is
+    logged and the app starts from whatever is on disk.
+    """
+    try:
+        stats = BundleSync(bucket, **options).pull([repository.root])
+        logging.info(
+            f"Pulled {stats['downloaded']} question file(s), {stats['unchanged']} unchanged, "
+            f"{(stats.get('bytes', 0) + stats.get('metadata_bytes', 0)) / 1024:.1f} KiB"
+        )
+    except Exception:
+        logging.exception("Pulling questions failed; starting from local files")
+    if os.path.isdir(repository.root):
+        build_corpus(repository.root, repository.corpus_path)
+        repository.warm()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Sync the page store and questions with an S3 bucket, moving only changed files"
+    )
+    arg_parser.add_argument("direction", choices=("push", "pull"))
+    arg_parser.add_argument(
+        "paths",
+        nargs="*",
+        default=DEFAULT_PATHS,
+        help=f"Files or directories to sync (default: {' '.join(DEFAULT_PATHS)})",
+    )
+    arg_parser.add_argument("--bucket", default=SYNC_BUCKET)
+    arg_parser.add_argument("--prefix", default=SYNC_PREFIX)
+    arg_parser.add_argument(
+        "--endpoint-url", default=SYNC_ENDPOINT_URL, help="S3-compatible endpoint, e.g. MinIO"
+    )
+    arg_parser.add_argument(
+        "--workers", type=int, default=SYNC_WORKERS, help="Files in flight at once"
+    )
+    arg_parser.add_argument(
+        "--delete", action="store_true", help="Also delete files the other side no longer has"
+    )
+    arg_parser.add_argument(
+        "--dry-run", action="store_true", help="Only report what would be transferred"
+    )
+    arg_parser.add_argument("--state", default=SYNC_STATE_PATH, help="Local sync state file")
+    arg_parser.add_argument(
+        "--metrics",
+        help="Record transfer metrics and save them to this file (.prom for Prometheus text, else JSON)",
+    )
+    args = arg_parser.parse_args()
+    METRICS.enable(bool(args.metrics))
+
+    sync = BundleSync(args.bucket, args.prefix, args.endpoint_url, args.workers, args.state)
+    started = time.perf_counter()
+    if args.direction == "push":
+        stats = sync.push(args.paths, args.delete, args.dry_run)
+        moved = f"{stats['uploaded']} uploaded"
+    else:
+        stats = sync.pull(args.paths, args.delete, args.dry_run)
+        moved = f"{stats['downloaded']} downloaded"
+    prefix = "Would sync" if args.dry_run else "Synced"
+    print(
+        f"{prefix} s3://{args.bucket}/{sync.prefix}: {moved}, {stats['deleted']} deleted, "
+        f"{stats['unchanged']} unchanged, {stats.get('failed', 0)} failed"
+    )
+    if not args.dry_run:
+        print(
+            f"Transferred {stats.get('bytes', 0) / 1024:.1f} KiB of files and "
+            f"{stats.get('metadata_bytes', 0) / 1024:.1f} KiB of manifest "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+    if args.metrics:
+        METRICS.write(args.metrics)
+        print(f"Metrics saved to {args.metrics}")
+    if stats.get("failed"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import json
+import os
+import re
+import tempfile
+
+
+QUESTION_NUMBER_PATTERN = re.compile(r"question (\d+)")
+
+
+def question_number(filename):
+    match = QUESTION_NUMBER_PATTERN.search(filename)
+    return int(match.group(1)) if match else None
+
+
+def question_sort_key(filename):
+    """
+    Order pages by question number, falling back to the filename
+    """
+    number = question_number(filename)
+    return (number is None, number or 0, filename)
+
+
+def write_json_atomic(path, data, **kwargs):
+    """
+    Write JSON to a temp file next to path and swap it in, so readers never
+    see a half-written file
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(data, file, **kwargs)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def answer_mask(letters):
+    """
+    Answer letters ("A", "C", ...) as a bitmask, bit 0 being "A"
+    """
+    mask = 0
+    for letter in letters:
+        mask |= 1 << (ord(letter) - ord("A"))
+    return mask
+
+
+def mask_letters(mask):
+    return [chr(ord("A") + i) for i in range(mask.bit_length()) if mask >> i & 1]
+
+
+WHITESPACE = re.compile(r"[\s,]*")
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    """
+    Yield the items of a top-level JSON array one at a time, reading the
+    file in chunks so memory stays bounded by the largest item
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size)
+    pos = WHITESPACE.match(buffer).end()
+    while pos == len(buffer):
+        chunk = file.read(chunk_size)
+        if not chunk:
+            raise ValueError("Expected a JSON array")
+        buffer = buffer[pos:] + chunk
+        pos = WHITESPACE.match(buffer).end()
+    if buffer[pos] != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+
+    eof = False
+    while True:
+        pos = WHITESPACE.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        if end == len(buffer) and not eof:
+            # A number could continue in the next chunk; read on first
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+        pos = end
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from crawler import Crawler, TokenBucket
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Records when each request arrived; /limited answers the first request
+    with 429 and Retry-After: 1
+    """
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, time.monotonic()))
+            limited = self.path == "/limited" and not server.limited
+            server.limited = server.limited or limited
+        if limited:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.limited = False
+    server.host = f"127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(server, rate, paths_by_job, **options):
+    """
+    Fetch each job's paths in order, all jobs concurrently; returns the crawler
+    """
+
+    async def run():
+        crawler = Crawler(rate_limits={server.host: (rate, 1)}, **options)
+
+        async def job(paths):
+            for path in paths:
+                await crawler.fetch(f"http://{server.host}{path}")
+
+        try:
+            await asyncio.gather(*(job(paths) for paths in paths_by_job))
+        finally:
+            crawler.close()
+        return crawler
+
+    return asyncio.run(run())
+
+
+def test_concurrent_jobs_share_one_host_budget(server):
+    rate = 20
+    crawl(server, rate, [[f"/a/{i}" for i in range(6)], [f"/b/{i}" for i in range(6)]])
+
+    times = sorted(arrived for _, arrived in server.requests)
+    assert len(times) == 12
+    # A capacity of 1 lets one request through at once, then one per 1/rate
+    for i, arrived in enumerate(times):
+        assert arrived - times[0] >= (i - 1) / rate - 0.01
+    assert {path[1] for path, _ in server.requests} == {"a", "b"}
+
+
+def test_retry_after_blocks_host_and_halves_rate(server):
+    rate = 20
+    crawler = crawl(server, rate, [["/limited"], ["/other"]], max_retries=1)
+
+    assert crawler.stats["rate_limited"] == 1
+    arrived = dict(server.requests[1:])
+    limited_at = server.requests[0][1]
+    assert server.requests[0][0] == "/limited"
+    # Neither the retry nor the other job's request went out during Retry-After
+    assert min(arrived.values()) - limited_at >= 0.95
+    # Halved by the 429, then two successes each won back a tenth
+    assert crawler.buckets[server.host].rate == pytest.approx(rate / 2 + 2 * rate / 10)
+
+
+def test_penalize_blocks_for_retry_after():
+    bucket = TokenBucket(8, capacity=4)
+
+    delay = bucket.penalize(2.5)
+
+    assert delay == 2.5
+    assert bucket.rate == 4
+    assert bucket.tokens == 0
+    assert bucket.blocked_until - time.monotonic() == pytest.approx(2.5, abs=0.1)
+    bucket.penalize(0)
+    assert bucket.rate == 2
+
+
+def test_reward_restores_rate(server):
+    rate = 50
+    crawler = crawl(server, rate, [["/limited"] + [f"/{i}" for i in range(5)]], max_retries=1)
+
+    bucket = crawler.buckets[server.host]
+    assert bucket.rate == rate
+    assert bucket.failures == 0
+    bucket.reward()
+    assert bucket.rate == rate
@@ -0,0 +1,105 @@
+import json
+import os
+import random
+import sys
+
+import pytest
+
+from parser import parse_page
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+from pipeline import synthetic_page, synthetic_record  # noqa: E402
+
+TALLY = [{"voted_answers": "B", "vote_count": 12, "is_most_voted": True}]
+
+
+def page(body, head=""):
+    return f"<!DOCTYPE html><html><head>{head}</head><body>\n{body}\n</body></html>\n"
+
+
+def question_body(question="Which service stores objects?", choices=None, after_choices=""):
+    choices = choices or (
+        '<li class="multi-choice-item"><span class="multi-choice-letter">A.</span> S3</li>\n'
+        '<li class="multi-choice-item"><span class="multi-choice-letter">B.</span> EBS</li>\n'
+    )
+    return (
+        '<div class="question-body mt-3">\n'
+        f'<p class="card-text">{question}</p>\n'
+        f'<div class="question-choices-container"><ul>\n{choices}</ul></div>\n'
+        f"{after_choices}"
+        '<p class="card-text question-answer">Suggested Answer: '
+        '<span class="correct-answer">B</span></p>\n'
+        '<div class="voted-answers-tally d-none"><script type="application/json">'
+        f"{json.dumps(TALLY)}</script></div>\n"
+        "</div>"
+    )
+
+
+EDGE_CASES = {
+    "div_in_script": page(
+        '<script>var open = "<div class=\\"question-body\\">", close = "</div></div>";</script>\n'
+        + question_body(after_choices='<script>document.write("<div>");</script>\n'),
+    ),
+    "closing_div_in_script": page(
+        question_body(after_choices='<script>var html = "</div></div>";</script>\n')
+    ),
+    "div_in_style": page(question_body(), head="<style>/* </div> */ .card-text{}</style>"),
+    "comments": page(
+        '<!-- <div class="question-body"><p class="card-text">Old</p></div> -->\n'
+        + question_body(after_choices="<!-- </div> --><!-- <div> -->\n")
+    ),
+    "nested_choices": page(
+        question_body(
+            choices='<li class="multi-choice-item"><div class="choice"><div>A. S3</div></div></li>\n'
+            '<li class="multi-choice-item"><div class="choice">B. <div>EBS</div></div></li>\n'
+        )
+    ),
+    "tally_outside_question": page(
+        question_body().replace('<div class="voted-answers-tally', '<div class="moved')
+        + '\n<div class="discussion"><div class="voted-answers-tally d-none">'
+        f'<script type="application/json">{json.dumps(TALLY)}</script></div></div>'
+    ),
+    "choices_before_question": page(
+        '<div class="question-choices-container"><ul><li class="multi-choice-item">A. S3</li>'
+        "</ul></div>\n" + question_body()
+    ),
+    "unclosed_p": page(question_body().replace("</p>\n", "\n", 1)),
+    "unclosed_region": page(question_body()[: -len("</div>")]),
+    "self_closing_div": page(question_body(after_choices='<div class="spacer"/>\n')),
+    "entities": page(question_body(question="A team&#39;s caf&eacute; &amp; &lt;bar&gt;")),
+    "missing_regions": page('<div class="question-body"><p class="card-text">Q</p></div>'),
+    "no_regions": page("<p>Nothing here</p>"),
+}
+
+
+def synthetic_pages(count=25):
+    rng = random.Random(0)
+    for number in range(1, count + 1):
+        record = synthetic_record(rng, number)
+        yield record["filename"], synthetic_page(rng, record).encode()
+
+
+def assert_same_records(raw_data, filename):
+    fast = parse_page(raw_data, filename, "fast")
+    full = parse_page(raw_data, filename, "full")
+    assert fast == full
+    return fast
+
+
+@pytest.mark.parametrize("filename, raw_data", list(synthetic_pages()))
+def test_fast_matches_full_on_synthetic_pages(filename, raw_data):
+    record = assert_same_records(raw_data, filename)
+    assert record["question"] and record["choices"] and record["user_data"]
+
+
+@pytest.mark.parametrize("name", sorted(EDGE_CASES))
+def test_fast_matches_full_on_edge_cases(name):
+    assert_same_records(EDGE_CASES[name].encode(), f"result_{name}.html")
+
+
+def test_fast_matches_full_on_non_utf8_pages():
+    html_content = page(question_body(question="Café naïve – résumé question"))
+    for encoding in ("cp1252", "latin-1", "utf-16"):
+        raw_data = html_content.replace("–", "-" if encoding == "latin-1" else "–")
+        record = assert_same_records(raw_data.encode(encoding), "result_encoded.html")
+        assert record["question"].startswith("Cafe naive")
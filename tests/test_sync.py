@@ -0,0 +1,157 @@
+import gzip
+import json
+import os
+
+import boto3
+import moto
+import pytest
+
+from sync import BundleSync
+
+BUCKET = "questions"
+PREFIX = "examtopics"
+PATHS = ["pages", "questions"]
+FILES = {
+    "pages/V/e/result_1.html": b"<html>question 1</html>",
+    "pages/V/e/result_2.html": b"<html>question 2</html>",
+    "pages/W/f/result_1.html": b"<html>other exam</html>",
+    "questions/V/e.json": b'[{"question": "1"}]',
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        monkeypatch.setenv(name, "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def write_files(root, files):
+    for path, content in files.items():
+        os.makedirs(root / os.path.dirname(path), exist_ok=True)
+        (root / path).write_bytes(content)
+
+
+def read_files(root):
+    return {
+        os.path.relpath(os.path.join(directory, filename), root).replace(os.sep, "/"): open(
+            os.path.join(directory, filename), "rb"
+        ).read()
+        for directory, _, filenames in os.walk(root)
+        for filename in filenames
+        if filename != ".sync_state.json"
+    }
+
+
+def keys(client, kind):
+    """
+    Names of the files or shards in the bucket
+    """
+    prefix = f"{PREFIX}/{kind}/"
+    response = client.list_objects_v2(Bucket=BUCKET, Prefix=prefix)
+    return {item["Key"][len(prefix) :] for item in response.get("Contents", [])}
+
+
+def sync_in(root, client, monkeypatch):
+    """
+    A fresh BundleSync working in root, as a new process there would
+    """
+    monkeypatch.chdir(root)
+    return BundleSync(
+        BUCKET, PREFIX, client=client, state_path=str(root / ".sync_state.json"), workers=2
+    )
+
+
+@pytest.fixture
+def source(tmp_path):
+    root = tmp_path / "source"
+    write_files(root, FILES)
+    return root
+
+
+def test_push_moves_only_changes(source, client, monkeypatch):
+    stats = sync_in(source, client, monkeypatch).push(PATHS)
+    assert stats["uploaded"] == len(FILES)
+    assert stats["bytes"] == sum(map(len, FILES.values()))
+    assert keys(client, "files") == set(FILES)
+    shards = keys(client, "shards")
+    # One shard per directory
+    assert len(shards) == 3
+
+    stats = sync_in(source, client, monkeypatch).push(PATHS)
+    assert stats["uploaded"] == 0
+    assert stats["unchanged"] == len(FILES)
+    assert stats.get("bytes", 0) == 0
+    # The index was not modified and every shard was cached
+    assert stats.get("metadata_bytes", 0) == 0
+
+    changed = b"<html>question 2, more votes</html>"
+    (source / "pages/V/e/result_2.html").write_bytes(changed)
+    stats = sync_in(source, client, monkeypatch).push(PATHS)
+    assert stats["uploaded"] == 1
+    assert stats["unchanged"] == len(FILES) - 1
+    assert stats["bytes"] == len(changed)
+    new_shards = keys(client, "shards") - shards
+    assert len(new_shards) == 1
+    shard = client.get_object(Bucket=BUCKET, Key=f"{PREFIX}/shards/{new_shards.pop()}")
+    body = shard["Body"].read()
+    assert set(json.loads(gzip.decompress(body))) == {
+        "pages/V/e/result_1.html",
+        "pages/V/e/result_2.html",
+    }
+
+
+def test_pull_round_trip(source, client, monkeypatch, tmp_path):
+    sync_in(source, client, monkeypatch).push(PATHS)
+    target = tmp_path / "target"
+    target.mkdir()
+
+    stats = sync_in(target, client, monkeypatch).pull(PATHS)
+    assert stats["downloaded"] == len(FILES)
+    assert read_files(target) == read_files(source) == FILES
+
+    stats = sync_in(target, client, monkeypatch).pull(PATHS)
+    assert stats["downloaded"] == 0
+    assert stats["unchanged"] == len(FILES)
+
+
+def test_delete(source, client, monkeypatch, tmp_path):
+    sync_in(source, client, monkeypatch).push(PATHS)
+    target = tmp_path / "target"
+    target.mkdir()
+    sync_in(target, client, monkeypatch).pull(PATHS)
+
+    os.unlink(source / "pages/W/f/result_1.html")
+    stats = sync_in(source, client, monkeypatch).push(PATHS)
+    assert stats["deleted"] == 0
+    assert "pages/W/f/result_1.html" in keys(client, "files")
+
+    stats = sync_in(source, client, monkeypatch).push(PATHS, delete=True)
+    assert stats["deleted"] == 1
+    assert "pages/W/f/result_1.html" not in keys(client, "files")
+
+    stats = sync_in(target, client, monkeypatch).pull(PATHS)
+    assert stats["deleted"] == 0
+    assert (target / "pages/W/f/result_1.html").exists()
+
+    stats = sync_in(target, client, monkeypatch).pull(PATHS, delete=True)
+    assert stats["deleted"] == 1
+    assert read_files(target) == read_files(source)
+
+
+def test_pull_delete_needs_a_manifest(source, client, monkeypatch):
+    sync_in(source, client, monkeypatch).push(PATHS)
+    monkeypatch.chdir(source)
+    # A mistyped prefix has no manifest; it must not look like an empty bucket
+    sync = BundleSync(
+        BUCKET, "examtopcs", client=client, state_path=str(source / ".sync_state.json")
+    )
+
+    with pytest.raises(ValueError, match="No manifest"):
+        sync.pull(PATHS, delete=True)
+    assert read_files(source) == FILES
+    assert sync.pull(PATHS)["downloaded"] == 0